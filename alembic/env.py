@@ -7,7 +7,7 @@ import os
 
 sys.path.append(os.getcwd())
 from app.infrastructure.database import Base
-from app.infrastructure.models import DocumentModel, DocumentTextModel
+from app.infrastructure.models import DocumentModel, DocumentTextModel, MIGRATION_ONLY_OBJECTS
 
 
 config = context.config
@@ -19,11 +19,18 @@ if config.config_file_name is not None:
 target_metadata = Base.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    if reflected and compare_to is None and name in MIGRATION_ONLY_OBJECTS:
+        return False
+    return True
+
+
 def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -41,7 +48,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_object=include_object
         )
 
         with context.begin_transaction():
@@ -0,0 +1,31 @@
+"""Keyset index on documents upload_date
+
+Revision ID: 3b7d0e4f8a21
+Revises: f2a83d5e9c16
+Create Date: 2026-10-18 16:41:18.559034
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7d0e4f8a21'
+down_revision: Union[str, None] = 'f2a83d5e9c16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("UPDATE documents SET upload_date = now() WHERE upload_date IS NULL")
+    op.alter_column('documents', 'upload_date', existing_type=sa.DateTime(timezone=True),
+                    existing_server_default=sa.text('now()'), nullable=False)
+    op.create_index('ix_documents_upload_date_id', 'documents', ['upload_date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_upload_date_id', table_name='documents')
+    op.alter_column('documents', 'upload_date', existing_type=sa.DateTime(timezone=True),
+                    existing_server_default=sa.text('now()'), nullable=True)
@@ -0,0 +1,34 @@
+"""document analysis state
+
+Revision ID: 5a0c8e3b6d94
+Revises: d7a4f19c3e62
+Create Date: 2026-10-19 16:48:05.904127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a0c8e3b6d94'
+down_revision: Union[str, None] = 'd7a4f19c3e62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('analysis_status', sa.String(length=20), nullable=True))
+    op.add_column('documents', sa.Column('analysis_task_id', sa.String(length=155), nullable=True))
+    op.add_column('documents', sa.Column('analysis_requested_at', sa.DateTime(timezone=True), nullable=True))
+    op.execute(
+        "UPDATE documents SET analysis_status = 'completed' "
+        "WHERE EXISTS (SELECT 1 FROM document_text WHERE document_text.document_id = documents.id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('documents', 'analysis_requested_at')
+    op.drop_column('documents', 'analysis_task_id')
+    op.drop_column('documents', 'analysis_status')
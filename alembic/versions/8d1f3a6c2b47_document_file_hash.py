@@ -0,0 +1,28 @@
+"""Document file hash
+
+Revision ID: 8d1f3a6c2b47
+Revises: 52fcb4933c0b
+Create Date: 2026-10-18 10:12:31.418207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d1f3a6c2b47'
+down_revision: Union[str, None] = '52fcb4933c0b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('file_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_documents_file_hash'), 'documents', ['file_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_documents_file_hash'), table_name='documents')
+    op.drop_column('documents', 'file_hash')
@@ -0,0 +1,30 @@
+"""Document size, content type and page count
+
+Revision ID: 9e6c1b2d7f58
+Revises: 3b7d0e4f8a21
+Create Date: 2026-10-19 09:17:44.120385
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e6c1b2d7f58'
+down_revision: Union[str, None] = '3b7d0e4f8a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('file_size', sa.BigInteger(), nullable=True))
+    op.add_column('documents', sa.Column('content_type', sa.String(length=100), nullable=True))
+    op.add_column('documents', sa.Column('page_count', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('documents', 'page_count')
+    op.drop_column('documents', 'content_type')
+    op.drop_column('documents', 'file_size')
@@ -0,0 +1,31 @@
+"""document analysis client
+
+Revision ID: a4e19c7d3b85
+Revises: 6f2d8b4c9e13
+Create Date: 2026-10-21 16:05:48.193624
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4e19c7d3b85'
+down_revision: Union[str, None] = '6f2d8b4c9e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('analysis_client', sa.String(length=100), nullable=True))
+    op.create_index('ix_documents_analysis_pending_client', 'documents', ['analysis_client'], unique=False,
+                    postgresql_where=sa.text("analysis_status = 'pending'"))
+    op.create_index('ix_documents_analysis_requested_at', 'documents', ['analysis_requested_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_analysis_requested_at', table_name='documents')
+    op.drop_index('ix_documents_analysis_pending_client', table_name='documents')
+    op.drop_column('documents', 'analysis_client')
@@ -0,0 +1,26 @@
+"""document_text layout
+
+Revision ID: b81f5d2e4a07
+Revises: 5a0c8e3b6d94
+Create Date: 2026-10-20 11:12:43.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81f5d2e4a07'
+down_revision: Union[str, None] = '5a0c8e3b6d94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('document_text', sa.Column('layout', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('document_text', 'layout')
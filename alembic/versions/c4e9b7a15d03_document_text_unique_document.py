@@ -0,0 +1,33 @@
+"""Unique document_text per document
+
+Revision ID: c4e9b7a15d03
+Revises: 8d1f3a6c2b47
+Create Date: 2026-10-18 14:03:52.771940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e9b7a15d03'
+down_revision: Union[str, None] = '8d1f3a6c2b47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # keep only the latest result of documents that were analyzed more than once
+    op.execute(
+        "DELETE FROM document_text older USING document_text newer "
+        "WHERE older.document_id = newer.document_id AND older.id < newer.id"
+    )
+    op.drop_index(op.f('ix_document_text_id'), table_name='document_text')
+    op.create_index(op.f('ix_document_text_document_id'), 'document_text', ['document_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_document_text_document_id'), table_name='document_text')
+    op.create_index(op.f('ix_document_text_id'), 'document_text', ['id'], unique=False)
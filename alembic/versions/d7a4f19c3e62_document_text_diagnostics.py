@@ -0,0 +1,26 @@
+"""document_text diagnostics
+
+Revision ID: d7a4f19c3e62
+Revises: 9e6c1b2d7f58
+Create Date: 2026-10-19 14:02:31.587210
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a4f19c3e62'
+down_revision: Union[str, None] = '9e6c1b2d7f58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('document_text', sa.Column('diagnostics', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('document_text', 'diagnostics')
@@ -0,0 +1,31 @@
+"""document_text cascade delete
+
+Revision ID: e3c72a9f1b56
+Revises: b81f5d2e4a07
+Create Date: 2026-10-20 15:27:39.861042
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3c72a9f1b56'
+down_revision: Union[str, None] = 'b81f5d2e4a07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_constraint('document_text_document_id_fkey', 'document_text', type_='foreignkey')
+    op.create_foreign_key(
+        'document_text_document_id_fkey', 'document_text', 'documents',
+        ['document_id'], ['id'], ondelete='CASCADE'
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('document_text_document_id_fkey', 'document_text', type_='foreignkey')
+    op.create_foreign_key('document_text_document_id_fkey', 'document_text', 'documents', ['document_id'], ['id'])
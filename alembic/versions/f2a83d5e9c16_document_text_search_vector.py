@@ -0,0 +1,36 @@
+"""Full-text search vector on document_text
+
+Revision ID: f2a83d5e9c16
+Revises: c4e9b7a15d03
+Create Date: 2026-10-18 15:26:07.302118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a83d5e9c16'
+down_revision: Union[str, None] = 'c4e9b7a15d03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the input is capped so very long documents stay under the 1MB tsvector limit
+    op.add_column('document_text', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('simple', left(extracted_text, 500000))", persisted=True),
+        nullable=True
+    ))
+    op.create_index('ix_document_text_search_vector', 'document_text', ['search_vector'],
+                    unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_document_text_search_vector', table_name='document_text', postgresql_using='gin')
+    op.drop_column('document_text', 'search_vector')
@@ -1,7 +1,9 @@
 from abc import ABC, abstractmethod
-from typing import Optional, List
+from datetime import datetime
+from typing import AsyncContextManager, AsyncIterator, Awaitable, ContextManager, Iterator, Optional, List
 
-from app.domain.entities import HealthStatus, Document, DocumentText
+from app.domain.entities import HealthStatus, Document, DocumentText, CachedDocumentText, DocumentDiagnostics, \
+    StoredFile, AnalysisBatch, DocumentSearchHit, DocumentListItem
 
 
 class IHealthCheckRepository(ABC):
@@ -12,7 +14,11 @@ class IHealthCheckRepository(ABC):
 
 class IDocumentRepository(ABC):
     @abstractmethod
-    async def save_document(self, file_path: str) -> Document:
+    async def save_document(self, stored_file: StoredFile) -> Document:
+        pass
+
+    @abstractmethod
+    async def save_documents(self, stored_files: List[StoredFile]) -> List[Document]:
         pass
 
     @abstractmethod
@@ -20,7 +26,17 @@ class IDocumentRepository(ABC):
         pass
 
     @abstractmethod
-    async def save_extracted_text(self, document_id: int, text: str) -> DocumentText:
+    async def get_documents(self, document_ids: List[int]) -> List[Document]:
+        pass
+
+    @abstractmethod
+    async def list_documents(self, limit: int, after: Optional[tuple[datetime, int]] = None,
+                             analyzed: Optional[bool] = None,
+                             uploaded_since: Optional[datetime] = None) -> List[DocumentListItem]:
+        pass
+
+    @abstractmethod
+    async def copy_extracted_text(self, source_document_id: int, document_id: int) -> bool:
         pass
 
     @abstractmethod
@@ -28,10 +44,110 @@ class IDocumentRepository(ABC):
         pass
 
     @abstractmethod
-    async def delete_document(self, document_id: int) -> bool:
+    async def claim_analyses(self, task_ids: dict[int, str], force: bool = False, commit: bool = True,
+                             client: Optional[str] = None) -> set[int]:
+        pass
+
+    @abstractmethod
+    async def release_analyses(self, task_ids: dict[int, str]) -> None:
+        pass
+
+    @abstractmethod
+    async def get_layout(self, document_id: int) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    async def get_diagnostics(self, document_id: int) -> Optional[DocumentDiagnostics]:
+        pass
+
+    @abstractmethod
+    async def get_text_by_file_hash(self, file_hash: str) -> Optional[DocumentText]:
         pass
 
+    @abstractmethod
+    async def search_text(self, query: str, limit: int, offset: int) -> tuple[List[DocumentSearchHit], bool]:
+        pass
+
+    @abstractmethod
+    async def delete_document(self, document_id: int) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def commit(self) -> None:
+        pass
+
+
+class IDocumentStorage(ABC):
+    @abstractmethod
+    def new_key(self, file_name: str) -> str:
+        pass
+
+    @abstractmethod
+    async def save(self, key: str, chunks: AsyncIterator[bytes]) -> None:
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def remove(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def iter_keys(self) -> Iterator[tuple[str, float]]:
+        pass
+
+    @abstractmethod
+    def local_path(self, key: str) -> ContextManager[str]:
+        pass
+
+
+class IDocumentTextCache(ABC):
+    @abstractmethod
+    def get(self, document_id: int) -> Optional[CachedDocumentText]:
+        pass
+
+    @abstractmethod
+    def generation(self) -> int:
+        pass
+
+    @abstractmethod
+    def set(self, cached: CachedDocumentText, generation: int) -> None:
+        pass
+
+    @abstractmethod
+    def invalidate(self, document_id: int) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+class IDocumentTextNotifier(ABC):
+    @abstractmethod
+    def subscribe(self, document_id: int) -> AsyncContextManager[Awaitable[None]]:
+        pass
+
+
+class ITaskOutbox(ABC):
+    @abstractmethod
+    async def add(self, task_ids: dict[int, str], preprocessing: Optional[dict] = None, force: bool = False) -> None:
+        pass
+
+
 class IAsyncWorker(ABC):
     @abstractmethod
-    async def analyze_document(self, document_id: int) -> str:
-        pass
\ No newline at end of file
+    async def analyze_document(self, document: Document, preprocessing: Optional[dict] = None,
+                               task_id: Optional[str] = None, force: bool = False) -> str:
+        pass
+
+    @abstractmethod
+    async def analyze_documents(self, documents: List[Document], preprocessing: Optional[dict] = None,
+                                task_ids: Optional[dict[int, str]] = None, force: bool = False) -> AnalysisBatch:
+        pass
+
+    @abstractmethod
+    async def track_group(self, task_ids: dict[int, str]) -> AnalysisBatch:
+        pass
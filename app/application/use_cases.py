@@ -1,101 +1,616 @@
 from fastapi import UploadFile
-from datetime import datetime
-from pathlib import Path
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Optional
+import asyncio
 import base64
-import os
-import shutil
+import binascii
+import hashlib
+import time
+import uuid
+import weakref
+import zipfile
+from pathlib import PurePosixPath
 
-from app.domain.entities import HealthStatus, Document, DocumentText
-from app.application.interfaces import IHealthCheckRepository, IDocumentRepository, IAsyncWorker
+from app.core.config import settings
+from app.domain.entities import HealthStatus, Document, DocumentText, CachedDocumentText, DocumentDiagnostics, StoredFile, AnalysisBatch, \
+    DocumentSearchHit, DocumentListItem, DocumentAnalysis, PageLayout, ANALYSIS_PENDING, ANALYSIS_COMPLETED
+from app.domain.exceptions import FileTooLargeError, UnsupportedFileTypeError
+from app.application.interfaces import IHealthCheckRepository, IDocumentRepository, IAsyncWorker, \
+    IDocumentTextNotifier, IDocumentStorage, IDocumentTextCache, ITaskOutbox
+from app.infrastructure.layout import LayoutReader
+from app.infrastructure.metrics import UPLOADED_BYTES
 from app.infrastructure.services import RabbitMQHealthCheck, TesseractHealthCheck
+from app.infrastructure.tasks import get_pdf_page_count
+
+FILE_SIGNATURES = {
+    b"%PDF-": "application/pdf",
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"\xff\xd8\xff": "image/jpeg",
+}
+FILE_SIGNATURE_SIZE = max(len(signature) for signature in FILE_SIGNATURES)
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
 
-BASE_DIR = Path(__file__).resolve().parent.parent
 
 class HealthCheckUseCase:
+    _cache: Optional[tuple[float, list[HealthStatus]]] = None
+    # an asyncio.Lock belongs to the loop it is first used on, so each loop gets its own
+    _locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
     def __init__(self, health_repo: IHealthCheckRepository):
         self.health_repo = health_repo
 
     async def execute(self) -> list[HealthStatus]:
-        base_statuses = [
+        statuses = self._cached_statuses()
+        if statuses is not None:
+            return statuses
+
+        async with self._lock():
+            statuses = self._cached_statuses()
+            if statuses is None:
+                statuses = await self._probe()
+                HealthCheckUseCase._cache = (time.monotonic(), statuses)
+
+        return statuses
+
+    @classmethod
+    def _lock(cls) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = cls._locks.get(loop)
+        if lock is None:
+            lock = cls._locks[loop] = asyncio.Lock()
+        return lock
+
+    @classmethod
+    def _cached_statuses(cls) -> Optional[list[HealthStatus]]:
+        if cls._cache is None:
+            return None
+
+        checked_at, statuses = cls._cache
+        if time.monotonic() - checked_at > settings.health_cache_ttl:
+            return None
+        return statuses
+
+    async def _probe(self) -> list[HealthStatus]:
+        probe_results = await asyncio.gather(
+            self._run_probe("Message Broker", asyncio.to_thread(RabbitMQHealthCheck.check)),
+            self._run_probe("OCR Engine", asyncio.to_thread(TesseractHealthCheck.check)),
+            self._run_probe("Database", self.health_repo.get_status()),
+        )
+
+        statuses = [
             HealthStatus(
                 service="API",
                 status="OK",
                 details="Service is running"
-            ),
-            RabbitMQHealthCheck.check(),
-            TesseractHealthCheck.check(),
+            )
         ]
+        for result in probe_results:
+            statuses.extend(result if isinstance(result, list) else [result])
+        return statuses
+
+    @staticmethod
+    async def _run_probe(service: str, probe: Awaitable) -> HealthStatus | list[HealthStatus]:
+        try:
+            return await asyncio.wait_for(probe, timeout=settings.health_probe_timeout)
+        except asyncio.TimeoutError:
+            return HealthStatus(
+                service=service,
+                status="Error",
+                details=f"Health probe timed out after {settings.health_probe_timeout}s"
+            )
+        except Exception as e:
+            return HealthStatus(
+                service=service,
+                status="Error",
+                details=str(e)
+            )
 
-        db_statuses = await self.health_repo.get_status()
-        return base_statuses + db_statuses
+
+def text_etag(doc_text: DocumentText) -> str:
+    digest = hashlib.sha256(doc_text.extracted_text.encode()).hexdigest()
+    return f'"{doc_text.document_id}-{digest[:32]}"'
 
 
 class GetDocumentTextUseCase:
-    def __init__(self, document_repo: IDocumentRepository):
+    def __init__(self, document_repo: IDocumentRepository, text_cache: IDocumentTextCache):
         self.document_repo = document_repo
+        self.text_cache = text_cache
 
-    async def execute(self, document_id: int) -> DocumentText:
+    async def execute(self, document_id: int) -> CachedDocumentText:
+        cached = self.text_cache.get(document_id)
+        if cached:
+            return cached
+
+        generation = self.text_cache.generation()
         doc_text = await self.document_repo.get_text_by_document(document_id)
 
         if not doc_text:
             raise ValueError(f"Text not found for document {document_id}")
 
-        return doc_text
+        cached = CachedDocumentText(text=doc_text, etag=await asyncio.to_thread(text_etag, doc_text))
+        self.text_cache.set(cached, generation)
+        return cached
 
 
-class DocumentUploadUseCase:
+class GetDocumentDiagnosticsUseCase:
     def __init__(self, document_repo: IDocumentRepository):
         self.document_repo = document_repo
-        self.upload_dir = BASE_DIR / "documents"
-        self.upload_dir.mkdir(exist_ok=True)
 
-    async def execute(self, file_name: str, file_content: str) -> Document:
-        file_data = base64.b64decode(file_content)
+    async def execute(self, document_id: int) -> DocumentDiagnostics:
+        diagnostics = await self.document_repo.get_diagnostics(document_id)
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_name = f"{timestamp}_{file_name}"
-        file_path = self.upload_dir / unique_name
+        if not diagnostics:
+            raise ValueError(f"Text not found for document {document_id}")
 
-        with open(file_path, "wb") as f:
-            f.write(file_data)
+        return diagnostics
 
-        return await self.document_repo.save_document(str(file_path))
 
+class GetDocumentLayoutUseCase:
+    def __init__(self, document_repo: IDocumentRepository):
+        self.document_repo = document_repo
 
-class DocumentUploadSwaggerUseCase:
+    async def execute(self, document_id: int, page: int, left: int = 0, top: int = 0,
+                      right: Optional[int] = None, bottom: Optional[int] = None,
+                      contained: bool = False) -> PageLayout:
+        layout = await self.document_repo.get_layout(document_id)
+
+        if layout is None:
+            raise ValueError(f"Layout not found for document {document_id}")
+
+        reader = LayoutReader(layout)
+        _, _, width, height = reader.page(page)
+        words = reader.words_in_rect(
+            page,
+            left,
+            top,
+            width if right is None else right,
+            height if bottom is None else bottom,
+            contained
+        )
+        return PageLayout(document_id=document_id, page=page, width=width, height=height, words=words)
+
+
+class ListDocumentsUseCase:
+    def __init__(self, document_repo: IDocumentRepository):
+        self.document_repo = document_repo
+
+    async def execute(self, limit: int, cursor: Optional[str] = None, analyzed: Optional[bool] = None,
+                      uploaded_since: Optional[datetime] = None) -> tuple[list[DocumentListItem], Optional[str]]:
+        after = self.decode_cursor(cursor) if cursor else None
+        items = await self.document_repo.list_documents(limit + 1, after, analyzed, uploaded_since)
+
+        if len(items) <= limit:
+            return items, None
+        items = items[:limit]
+        return items, self.encode_cursor(items[-1])
+
+    @staticmethod
+    def encode_cursor(item: DocumentListItem) -> str:
+        raw = f"{item.upload_date.isoformat()}|{item.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple[datetime, int]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            upload_date, document_id = raw.rsplit("|", 1)
+            return datetime.fromisoformat(upload_date), int(document_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Invalid cursor")
+
+
+class SearchDocumentTextUseCase:
     def __init__(self, document_repo: IDocumentRepository):
         self.document_repo = document_repo
-        self.upload_dir = BASE_DIR / "documents"
-        self.upload_dir.mkdir(exist_ok=True)
+
+    async def execute(self, query: str, limit: int, offset: int) -> tuple[list[DocumentSearchHit], bool, bool]:
+        query = query.strip()
+        if not query:
+            raise ValueError("Search query must not be empty")
+
+        hits, truncated = await self.document_repo.search_text(query, limit + 1, offset)
+        return hits[:limit], len(hits) > limit, truncated
+
+
+class WaitDocumentTextUseCase:
+    def __init__(self, document_repo: IDocumentRepository, notifier: IDocumentTextNotifier):
+        self.document_repo = document_repo
+        self.notifier = notifier
+
+    async def execute(self, document_id: int, timeout: float) -> Optional[DocumentText]:
+        document = await self.document_repo.get_document(document_id)
+        if not document:
+            raise ValueError(f"Document {document_id} not found")
+
+        async with self.notifier.subscribe(document_id) as text_ready:
+            doc_text = await self.document_repo.get_text_by_document(document_id)
+            # release the pooled connection while the request waits
+            await self.document_repo.commit()
+            if doc_text:
+                return doc_text
+
+            try:
+                await asyncio.wait_for(text_ready, timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+
+        return await self.document_repo.get_text_by_document(document_id)
+
+
+async def iter_base64_chunks(content: str, chunk_size: int) -> AsyncIterator[bytes]:
+    step = max(chunk_size // 3 * 4, 4)
+    carry = ""
+    for start in range(0, len(content), step):
+        encoded = carry + "".join(content[start:start + step].split())
+        usable = len(encoded) - len(encoded) % 4
+        carry = encoded[usable:]
+        if usable:
+            yield base64.b64decode(encoded[:usable], validate=True)
+
+    if carry:
+        raise binascii.Error("Incorrect base64 padding")
+
+
+async def iter_upload_chunks(file: UploadFile, chunk_size: int) -> AsyncIterator[bytes]:
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+def detect_content_type(head: bytes) -> Optional[str]:
+    for signature, content_type in FILE_SIGNATURES.items():
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def count_pdf_pages(file_path: str) -> Optional[int]:
+    try:
+        return get_pdf_page_count(file_path)
+    except RuntimeError:
+        return None
+
+
+class UploadReader:
+    def __init__(self, chunks: AsyncIterator[bytes], max_size: int):
+        self.chunks = chunks
+        self.max_size = max_size
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.chunks:
+            if len(self.head) < FILE_SIGNATURE_SIZE:
+                self.head += chunk[:FILE_SIGNATURE_SIZE - len(self.head)]
+            self.size += len(chunk)
+            if self.size > self.max_size:
+                raise FileTooLargeError(f"File exceeds maximum upload size of {self.max_size} bytes")
+            await asyncio.to_thread(self.digest.update, chunk)
+            yield chunk
+
+
+def count_stored_pdf_pages(storage: IDocumentStorage, key: str) -> Optional[int]:
+    with storage.local_path(key) as file_path:
+        return count_pdf_pages(file_path)
+
+
+async def write_upload(storage: IDocumentStorage, file_name: str, chunks: AsyncIterator[bytes],
+                       max_size: int) -> StoredFile:
+    key = storage.new_key(file_name)
+    reader = UploadReader(chunks, max_size)
+    await storage.save(key, reader.__aiter__())
+
+    stored_file = StoredFile(
+        file_path=key,
+        file_hash=reader.digest.hexdigest(),
+        file_size=reader.size,
+        content_type=detect_content_type(reader.head)
+    )
+    if stored_file.content_type == "application/pdf":
+        stored_file.page_count = await asyncio.to_thread(count_stored_pdf_pages, storage, key)
+
+    UPLOADED_BYTES.labels(content_type=stored_file.content_type or "unknown").inc(reader.size)
+    return stored_file
+
+
+async def save_uploaded_document(document_repo: IDocumentRepository, storage: IDocumentStorage,
+                                 stored_file: StoredFile) -> Document:
+    try:
+        return await document_repo.save_document(stored_file)
+    except BaseException:
+        await storage.delete(stored_file.file_path)
+        raise
+
+
+class DocumentUploadUseCase:
+    def __init__(self, document_repo: IDocumentRepository, storage: IDocumentStorage):
+        self.document_repo = document_repo
+        self.storage = storage
+
+    async def execute(self, file_name: str, file_content: str) -> Document:
+        if len(file_content) * 3 // 4 > settings.max_upload_size:
+            raise FileTooLargeError(f"File exceeds maximum upload size of {settings.max_upload_size} bytes")
+
+        stored_file = await write_upload(
+            self.storage,
+            file_name,
+            iter_base64_chunks(file_content, settings.upload_chunk_size),
+            settings.max_upload_size
+        )
+
+        return await save_uploaded_document(self.document_repo, self.storage, stored_file)
+
+
+class DocumentUploadSwaggerUseCase:
+    def __init__(self, document_repo: IDocumentRepository, storage: IDocumentStorage):
+        self.document_repo = document_repo
+        self.storage = storage
 
     async def execute(self, file: UploadFile) -> Document:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_name = f"{timestamp}_{file.filename}"
-        file_path = self.upload_dir / unique_name
+        stored_file = await write_upload(
+            self.storage,
+            file.filename or "",
+            iter_upload_chunks(file, settings.upload_chunk_size),
+            settings.max_upload_size
+        )
+        stored_file.content_type = stored_file.content_type or file.content_type
+
+        return await save_uploaded_document(self.document_repo, self.storage, stored_file)
+
+
+def is_zip_upload(file: UploadFile) -> bool:
+    return file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+
+def archive_members(archive: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    return [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith("__MACOSX/")
+        and not PurePosixPath(info.filename).name.startswith(".")
+    ]
+
+
+async def iter_archive_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, chunk_size: int) -> AsyncIterator[bytes]:
+    # members are inflated chunk by chunk straight into storage
+    member = await asyncio.to_thread(archive.open, info)
+    try:
+        while chunk := await asyncio.to_thread(member.read, chunk_size):
+            yield chunk
+    finally:
+        await asyncio.to_thread(member.close)
+
+
+class DocumentBulkUploadUseCase:
+    def __init__(self, document_repo: IDocumentRepository, storage: IDocumentStorage):
+        self.document_repo = document_repo
+        self.storage = storage
+        self.total_size = 0
+
+    async def execute(self, files: list[UploadFile]) -> list[tuple[str, Document]]:
+        archives = []
+        try:
+            sources = []
+            for file in files:
+                if not is_zip_upload(file):
+                    sources.append((file.filename or "", iter_upload_chunks(file, settings.upload_chunk_size)))
+                    continue
+
+                # multipart parts are spooled to disk, so the archive is read in place rather than in memory
+                try:
+                    archive = await asyncio.to_thread(zipfile.ZipFile, file.file)
+                except zipfile.BadZipFile as e:
+                    raise ValueError(f"Invalid ZIP archive {file.filename}: {str(e)}")
+                archives.append(archive)
+                sources.extend(
+                    (PurePosixPath(info.filename).name, iter_archive_member(archive, info, settings.upload_chunk_size))
+                    for info in archive_members(archive)
+                )
+
+            if not sources:
+                raise ValueError("No files to upload")
+            if len(sources) > settings.bulk_upload_max_files:
+                raise ValueError(f"Bulk upload is limited to {settings.bulk_upload_max_files} files")
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            stored_files = await self.store_all(sources)
+        finally:
+            for archive in archives:
+                archive.close()
 
-        return await self.document_repo.save_document(str(file_path))
+        try:
+            documents = await self.document_repo.save_documents(stored_files)
+        except BaseException:
+            await asyncio.gather(*(self.storage.delete(stored_file.file_path) for stored_file in stored_files))
+            raise
+
+        return [(file_name, document) for (file_name, _), document in zip(sources, documents)]
+
+    async def store_all(self, sources: list[tuple[str, AsyncIterator[bytes]]]) -> list[StoredFile]:
+        semaphore = asyncio.Semaphore(max(settings.bulk_upload_concurrency, 1))
+
+        async def store(file_name: str, chunks: AsyncIterator[bytes]) -> StoredFile:
+            async with semaphore:
+                stored_file = await write_upload(
+                    self.storage, file_name, self.count_total(chunks), settings.max_upload_size
+                )
+            if stored_file.content_type is None:
+                await self.storage.delete(stored_file.file_path)
+                raise UnsupportedFileTypeError(
+                    f"Unsupported file type of {file_name}. Allowed types: {', '.join(FILE_SIGNATURES.values())}"
+                )
+            return stored_file
+
+        results = await asyncio.gather(*(store(file_name, chunks) for file_name, chunks in sources),
+                                       return_exceptions=True)
+        failures = [result for result in results if isinstance(result, BaseException)]
+        if failures:
+            # all or nothing: files stored before the failure are removed again
+            await asyncio.gather(*(
+                self.storage.delete(result.file_path) for result in results if isinstance(result, StoredFile)
+            ))
+            raise failures[0]
+        return results
+
+    async def count_total(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        async for chunk in chunks:
+            self.total_size += len(chunk)
+            if self.total_size > settings.bulk_upload_max_total_size:
+                raise FileTooLargeError(
+                    f"Bulk upload exceeds maximum total size of {settings.bulk_upload_max_total_size} bytes"
+                )
+            yield chunk
 
 
 class DocumentDeleteUseCase:
-    def __init__(self, document_repo: IDocumentRepository):
+    def __init__(self, document_repo: IDocumentRepository, storage: IDocumentStorage,
+                 text_cache: Optional[IDocumentTextCache] = None):
         self.document_repo = document_repo
+        self.storage = storage
+        self.text_cache = text_cache
 
     async def execute(self, document_id: int) -> bool:
-        return await self.document_repo.delete_document(document_id)
+        file_path = await self.document_repo.delete_document(document_id)
+        if file_path is None:
+            return False
+        if self.text_cache:
+            self.text_cache.invalidate(document_id)
+
+        try:
+            await self.storage.delete(file_path)
+        except OSError:
+            return False
+        return True
+
+
+def current_analysis(document: Document) -> Optional[DocumentAnalysis]:
+    if document.analysis_status == ANALYSIS_COMPLETED:
+        return DocumentAnalysis(document_id=document.id, status="completed", task_id=document.analysis_task_id)
+
+    if document.analysis_status == ANALYSIS_PENDING and document.analysis_requested_at is not None:
+        age = datetime.now(timezone.utc) - document.analysis_requested_at
+        if age.total_seconds() < settings.analysis_claim_timeout:
+            return DocumentAnalysis(document_id=document.id, status="in_progress", task_id=document.analysis_task_id)
+
+    return None
+
+
+async def claim_analyses(document_repo: IDocumentRepository, outbox: Optional[ITaskOutbox], task_ids: dict[int, str],
+                         preprocessing: Optional[dict], force: bool, client: Optional[str] = None) -> set[int]:
+    if outbox is None:
+        return await document_repo.claim_analyses(task_ids, force, client=client)
+
+    # the claims and their tasks commit together; the outbox relay publishes the tasks afterwards
+    claimed = await document_repo.claim_analyses(task_ids, force, commit=False, client=client)
+    if claimed:
+        await outbox.add({document_id: task_ids[document_id] for document_id in claimed}, preprocessing, force)
+    await document_repo.commit()
+    return claimed
 
 
 class DocumentAnalyzeUseCase:
-    def __init__(self, async_worker: IAsyncWorker, document_repo: IDocumentRepository):
+    def __init__(self, async_worker: IAsyncWorker, document_repo: IDocumentRepository,
+                 outbox: Optional[ITaskOutbox] = None):
         self.async_worker = async_worker
         self.document_repo = document_repo
+        self.outbox = outbox
 
-    async def execute(self, document_id: int) -> str:
+    async def execute(self, document_id: int, preprocessing: Optional[dict] = None,
+                      force: bool = False, client: Optional[str] = None) -> DocumentAnalysis:
         document = await self.document_repo.get_document(document_id)
         if not document:
             raise ValueError("Document not found")
 
-        task_id = await self.async_worker.analyze_document(document_id)
-        return task_id
\ No newline at end of file
+        if not force:
+            analysis = current_analysis(document)
+            if analysis:
+                return analysis
+
+            # a text found by file hash may have been read with other preprocessing
+            if document.file_hash and not preprocessing:
+                cached_text = await self.document_repo.get_text_by_file_hash(document.file_hash)
+                if cached_text and (cached_text.document_id == document_id or
+                                    await self.document_repo.copy_extracted_text(cached_text.document_id, document_id)):
+                    return DocumentAnalysis(document_id=document_id, status="completed")
+
+        task_id = str(uuid.uuid4())
+        if not await claim_analyses(self.document_repo, self.outbox, {document_id: task_id}, preprocessing, force,
+                                    client):
+            # a concurrent request claimed the document between the check and the claim
+            document = await self.document_repo.get_document(document_id)
+            return current_analysis(document) or DocumentAnalysis(
+                document_id=document_id,
+                status="in_progress",
+                task_id=document.analysis_task_id
+            )
+
+        if self.outbox is None:
+            try:
+                await self.async_worker.analyze_document(document, preprocessing, task_id, force)
+            except Exception:
+                await self.document_repo.release_analyses({document_id: task_id})
+                raise
+
+        return DocumentAnalysis(document_id=document_id, status="started", task_id=task_id)
+
+
+class DocumentBatchAnalyzeUseCase:
+    def __init__(self, async_worker: IAsyncWorker, document_repo: IDocumentRepository,
+                 outbox: Optional[ITaskOutbox] = None):
+        self.async_worker = async_worker
+        self.document_repo = document_repo
+        self.outbox = outbox
+
+    async def execute(self, document_ids: list[int], preprocessing: Optional[dict] = None,
+                      force: bool = False, client: Optional[str] = None) -> AnalysisBatch:
+        document_ids = list(dict.fromkeys(document_ids))
+        documents = await self.document_repo.get_documents(document_ids)
+
+        found_ids = {document.id for document in documents}
+        missing_ids = [document_id for document_id in document_ids if document_id not in found_ids]
+        if missing_ids:
+            raise ValueError(f"Documents not found: {', '.join(map(str, missing_ids))}")
+
+        documents_by_id = {document.id: document for document in documents}
+        coalesced = {}
+        if not force:
+            for document in documents:
+                analysis = current_analysis(document)
+                if analysis:
+                    coalesced[document.id] = analysis
+
+        task_ids = {
+            document_id: str(uuid.uuid4())
+            for document_id in document_ids
+            if document_id not in coalesced
+        }
+        claimed = await claim_analyses(self.document_repo, self.outbox, task_ids, preprocessing, force, client) \
+            if task_ids else set()
+
+        lost_ids = [document_id for document_id in task_ids if document_id not in claimed]
+        if lost_ids:
+            for document in await self.document_repo.get_documents(lost_ids):
+                coalesced[document.id] = current_analysis(document) or DocumentAnalysis(
+                    document_id=document.id,
+                    status="in_progress",
+                    task_id=document.analysis_task_id
+                )
+
+        claimed_task_ids = {document_id: task_ids[document_id] for document_id in document_ids if document_id in claimed}
+        if claimed_task_ids and self.outbox is not None:
+            batch = await self.async_worker.track_group(claimed_task_ids)
+        elif claimed_task_ids:
+            try:
+                batch = await self.async_worker.analyze_documents(
+                    [documents_by_id[document_id] for document_id in claimed_task_ids],
+                    preprocessing,
+                    claimed_task_ids,
+                    force
+                )
+            except Exception:
+                await self.document_repo.release_analyses(claimed_task_ids)
+                raise
+        else:
+            batch = AnalysisBatch(group_id=None, task_ids={})
+
+        batch.coalesced = [coalesced[document_id] for document_id in document_ids if document_id in coalesced]
+        return batch
@@ -1,5 +1,10 @@
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
+
+ANALYSIS_PENDING = "pending"
+ANALYSIS_COMPLETED = "completed"
+ANALYSIS_FAILED = "failed"
 
 @dataclass
 class HealthStatus:
@@ -7,14 +12,82 @@ class HealthStatus:
     status: str
     details: str = ""
 
+@dataclass
+class StoredFile:
+    file_path: str
+    file_hash: str
+    file_size: int
+    content_type: Optional[str] = None
+    page_count: Optional[int] = None
+
 @dataclass
 class Document:
     id: int
     file_path: str
     upload_date: datetime
+    file_hash: Optional[str] = None
+    file_size: Optional[int] = None
+    content_type: Optional[str] = None
+    page_count: Optional[int] = None
+    analysis_status: Optional[str] = None
+    analysis_task_id: Optional[str] = None
+    analysis_requested_at: Optional[datetime] = None
+
+@dataclass
+class DocumentAnalysis:
+    document_id: int
+    status: str
+    task_id: Optional[str] = None
 
 @dataclass
 class DocumentText:
     id: int
     document_id: int
-    extracted_text: str
\ No newline at end of file
+    extracted_text: str
+
+@dataclass
+class CachedDocumentText:
+    text: DocumentText
+    etag: str
+
+@dataclass
+class DocumentDiagnostics:
+    document_id: int
+    diagnostics: Optional[dict]
+
+@dataclass
+class DocumentListItem:
+    id: int
+    file_path: str
+    upload_date: datetime
+    analyzed: bool
+
+@dataclass
+class DocumentSearchHit:
+    document_id: int
+    rank: float
+    snippet: str
+
+@dataclass
+class AnalysisBatch:
+    group_id: Optional[str]
+    task_ids: dict[int, str]
+    coalesced: list[DocumentAnalysis] = field(default_factory=list)
+
+@dataclass
+class LayoutWord:
+    text: str
+    left: int
+    top: int
+    width: int
+    height: int
+    line: int
+    confidence: float
+
+@dataclass
+class PageLayout:
+    document_id: int
+    page: int
+    width: int
+    height: int
+    words: list[LayoutWord]
@@ -1,2 +1,10 @@
 class ServiceUnavailableError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+class UnsupportedFileTypeError(Exception):
+    pass
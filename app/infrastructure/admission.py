@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.domain.entities import ANALYSIS_PENDING
+from app.infrastructure.celery import celery_app
+from app.infrastructure.database import async_session
+from app.infrastructure.metrics import ADMISSION_REJECTED, ANALYSIS_BACKLOG, ANALYSIS_THROUGHPUT
+from app.infrastructure.models import DocumentModel
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+THROUGHPUT_SMOOTHING = 0.3
+
+
+def pending_analyses(stale_before: datetime):
+    # claims older than the claim timeout are dead and no longer hold anyone back
+    documents = DocumentModel.__table__
+    return select(documents.c.analysis_client, func.count()) \
+        .where(documents.c.analysis_status == ANALYSIS_PENDING, documents.c.analysis_requested_at >= stale_before) \
+        .group_by(documents.c.analysis_client)
+
+
+def requested_analyses(since: datetime):
+    documents = DocumentModel.__table__
+    return select(func.count()).where(documents.c.analysis_requested_at >= since)
+
+
+def broker_queue_depth(queues: list[str]) -> int:
+    depth = 0
+    with celery_app.pool.acquire(block=True) as connection:
+        for queue in queues:
+            # a failed passive declare closes its channel, so every queue gets a fresh one
+            channel = connection.channel()
+            try:
+                depth += channel.queue_declare(queue=queue, passive=True).message_count
+            except connection.channel_errors:
+                pass
+            finally:
+                channel.close()
+    return depth
+
+
+@dataclass
+class BacklogSnapshot:
+    refreshed_at: float
+    requested_at: datetime
+    pending: int
+    pending_by_client: dict[Optional[str], int]
+    queued: int
+    throughput: float
+
+
+@dataclass
+class AdmittedSinceRefresh:
+    total: int = 0
+    by_client: Counter = field(default_factory=Counter)
+
+
+class AdmissionController:
+    def __init__(self):
+        self.snapshot: Optional[BacklogSnapshot] = None
+        self._admitted = AdmittedSinceRefresh()
+        self._task = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # requests are admitted unchecked once the snapshot goes stale
+                logger.warning("Admission control cannot refresh the backlog: %s", e)
+            await asyncio.sleep(settings.admission_refresh_interval)
+
+    async def refresh(self) -> None:
+        started = time.monotonic()
+        previous = self.snapshot
+        # requests admitted while the counts are read are counted twice until the next refresh,
+        # which errs on the side of rejecting
+        admitted, self._admitted = self._admitted, AdmittedSinceRefresh()
+
+        try:
+            async with async_session() as session:
+                # database time, so arrivals are counted against the clock that stamped them
+                requested_at = await session.scalar(select(func.now()))
+                stale_before = requested_at - timedelta(seconds=settings.analysis_claim_timeout)
+                pending_by_client = dict((await session.execute(pending_analyses(stale_before))).all())
+                arrivals = await session.scalar(requested_analyses(previous.requested_at)) if previous else 0
+            queued = await asyncio.to_thread(
+                broker_queue_depth, [settings.ocr_small_queue, settings.ocr_large_queue]
+            )
+        except Exception:
+            self._admitted.total += admitted.total
+            self._admitted.by_client.update(admitted.by_client)
+            raise
+
+        pending = sum(pending_by_client.values())
+        throughput = 0.0
+        if previous is not None:
+            elapsed = started - previous.refreshed_at
+            finished = max(previous.pending + arrivals - pending, 0)
+            rate = finished / elapsed if elapsed > 0 else 0.0
+            throughput = THROUGHPUT_SMOOTHING * rate + (1 - THROUGHPUT_SMOOTHING) * previous.throughput
+
+        self.snapshot = BacklogSnapshot(started, requested_at, pending, pending_by_client, queued, throughput)
+        ANALYSIS_BACKLOG.labels(source="pending").set(pending)
+        ANALYSIS_BACKLOG.labels(source="queued").set(queued)
+        ANALYSIS_THROUGHPUT.set(throughput)
+
+    def backlog_limit(self, traffic_class: str) -> int:
+        limit = settings.admission_max_backlog
+        if settings.admission_target_wait is not None and self.snapshot.throughput > 0:
+            # no more than the workers clear within the target wait
+            limit = min(limit, max(int(self.snapshot.throughput * settings.admission_target_wait),
+                                   settings.admission_min_backlog))
+        if traffic_class == BATCH:
+            # the top of the backlog is reserved for single-document requests
+            limit = int(limit * (1 - settings.admission_interactive_share))
+        return limit
+
+    def retry_after(self, excess: int) -> int:
+        throughput = self.snapshot.throughput
+        seconds = math.ceil(excess / throughput) if throughput > 0 else settings.admission_max_retry_after
+        return min(max(seconds, 1), settings.admission_max_retry_after)
+
+    def check(self, client: str, traffic_class: str, count: int = 1) -> Optional[int]:
+        snapshot = self.snapshot
+        if not settings.admission_enabled or snapshot is None \
+                or time.monotonic() - snapshot.refreshed_at > settings.admission_stale_after:
+            return None
+
+        # the request's own analyses must fit under the limit too; one larger than the whole limit
+        # is let in once the backlog has drained
+        backlog = max(snapshot.pending, snapshot.queued) + self._admitted.total
+        limit = self.backlog_limit(traffic_class)
+        if backlog + min(count, limit) > limit:
+            ADMISSION_REJECTED.labels(traffic_class=traffic_class, reason="global").inc()
+            return self.retry_after(backlog + min(count, limit) - limit)
+
+        client_limit = settings.admission_client_max_backlog
+        client_backlog = snapshot.pending_by_client.get(client, 0) + self._admitted.by_client[client]
+        if client_backlog + min(count, client_limit) > client_limit:
+            ADMISSION_REJECTED.labels(traffic_class=traffic_class, reason="client").inc()
+            return self.retry_after(client_backlog + min(count, client_limit) - client_limit)
+
+        return None
+
+    def record(self, client: str, count: int) -> None:
+        if count:
+            self._admitted.total += count
+            self._admitted.by_client[client] += count
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,93 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from app.application.interfaces import IDocumentTextCache
+from app.domain.entities import CachedDocumentText
+from app.core.config import settings
+from app.infrastructure.metrics import CACHE_REQUESTS, CACHE_EVICTIONS
+
+
+class TTLCache:
+    def __init__(self, name: str, max_entries: int, max_bytes: int, ttl: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self._size = 0
+        # bumped on every invalidation so a lookup that raced with one does not store a stale value
+        self.generation = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            CACHE_REQUESTS.labels(cache=self.name, result="miss").inc()
+            return None
+
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self._pop(key)
+            CACHE_REQUESTS.labels(cache=self.name, result="expired").inc()
+            return None
+
+        self._entries.move_to_end(key)
+        CACHE_REQUESTS.labels(cache=self.name, result="hit").inc()
+        return value
+
+    def set(self, key: Hashable, value: Any, size: int, generation: Optional[int] = None) -> None:
+        if generation is not None and generation != self.generation:
+            return
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+
+        self._pop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._size += size
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._pop(oldest)
+            CACHE_EVICTIONS.labels(cache=self.name).inc()
+
+    def invalidate(self, key: Hashable) -> None:
+        self.generation += 1
+        self._pop(key)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._size = 0
+
+    def _pop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+
+class DocumentTextCache(IDocumentTextCache):
+    def __init__(self, cache: TTLCache):
+        self.cache = cache
+
+    def get(self, document_id: int) -> Optional[CachedDocumentText]:
+        return self.cache.get(document_id)
+
+    def generation(self) -> int:
+        return self.cache.generation
+
+    def set(self, cached: CachedDocumentText, generation: int) -> None:
+        # str length is a cheap stand-in for the memory held by the text
+        self.cache.set(cached.text.document_id, cached, len(cached.text.extracted_text), generation)
+
+    def invalidate(self, document_id: int) -> None:
+        self.cache.invalidate(document_id)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+document_text_cache = DocumentTextCache(TTLCache(
+    "document_text",
+    max_entries=settings.text_cache_max_entries,
+    max_bytes=settings.text_cache_max_bytes,
+    ttl=settings.text_cache_ttl
+))
@@ -1,6 +1,12 @@
-from celery import Celery
+from celery import Celery, bootsteps
+from celery.backends.base import DisabledBackend
+from celery.backends.rpc import RPCBackend
+from celery.exceptions import ImproperlyConfigured
+from celery.signals import worker_init
+from kombu import Queue
 
 from app.core.config import settings
+from app.infrastructure.concurrency import ThroughputTuner, configure_worker_concurrency
 
 celery_app = Celery(
     "doc_processor",
@@ -15,4 +21,69 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
-)
\ No newline at end of file
+    task_queues=(
+        Queue(settings.ocr_small_queue),
+        Queue(settings.ocr_large_queue),
+        Queue(settings.maintenance_queue),
+    ),
+    task_default_queue=settings.ocr_small_queue,
+    beat_schedule={
+        "apply-retention": {
+            "task": "apply_retention",
+            "schedule": settings.retention_interval,
+            "options": {"queue": settings.maintenance_queue, "expires": settings.retention_interval},
+        },
+    },
+)
+
+
+
+class ChordBackendCheck(bootsteps.Step):
+    # multi-page PDFs are saved by a chord, and without a backend that supports chords they would
+    # fail only after all their pages were recognized; signal handlers cannot stop the worker, a step can
+    label = "Chord backend check"
+
+    def __init__(self, w, **kwargs):
+        super().__init__(w, **kwargs)
+        if isinstance(w.app.backend, (RPCBackend, DisabledBackend)):
+            raise ImproperlyConfigured(
+                f"CELERY_RESULT_BACKEND={settings.celery_result_backend!r} does not support chords; "
+                "use a backend such as redis:// or db+postgresql://"
+            )
+
+
+celery_app.steps["worker"].add(ChordBackendCheck)
+celery_app.steps["worker"].add(ThroughputTuner)
+
+if settings.worker_cpu_mode == "auto":
+    configure_worker_concurrency(celery_app)
+
+QUEUE_PROFILES = {
+    settings.ocr_small_queue: (settings.ocr_small_prefetch_multiplier, settings.ocr_small_acks_late),
+    settings.ocr_large_queue: (settings.ocr_large_prefetch_multiplier, settings.ocr_large_acks_late),
+}
+
+if settings.task_dispatch_mode == "outbox":
+    # the relay deletes outbox messages once published, so it waits for the broker to confirm them
+    celery_app.conf.broker_transport_options = {"confirm_publish": True}
+
+if settings.ocr_write_behind_enabled:
+    # tasks return only after their buffered result is flushed, so a late ack never outruns the write
+    celery_app.conf.update(
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
+    )
+
+
+@worker_init.connect
+def apply_queue_profile(sender=None, **kwargs):
+    # prefetch and late acks are per worker in Celery, so they follow the queues this worker consumes
+    profiles = [QUEUE_PROFILES[name] for name in sender.app.amqp.queues.consume_from if name in QUEUE_PROFILES]
+    if not profiles:
+        return
+
+    sender.prefetch_multiplier = min(prefetch for prefetch, _ in profiles)
+    acks_late = any(late for _, late in profiles) or settings.ocr_write_behind_enabled
+    for task in sender.app.tasks.values():
+        if not task.name.startswith("celery."):
+            task.acks_late = acks_late
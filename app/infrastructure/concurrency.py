@@ -0,0 +1,213 @@
+import logging
+import os
+import time
+from multiprocessing.sharedctypes import RawValue
+from typing import Optional
+
+from celery import bootsteps
+from celery.signals import task_prerun, worker_init, worker_process_init, worker_ready
+from celery.worker import state
+
+from app.core.config import settings
+from app.infrastructure.metrics import WORKER_CPU_LAYOUT, WORKER_TASK_RATE
+
+logger = logging.getLogger(__name__)
+
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_CPU_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_CPU_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+OCR_THREAD_LIMIT_ENV = "OMP_THREAD_LIMIT"
+TUNER_HOLD_SAMPLES = 10
+
+# created before the pool forks, so every pool process reads the limit the main process sets
+ocr_thread_limit = RawValue("i", 0)
+
+
+def read_number(path: str) -> int:
+    with open(path) as f:
+        return int(f.read())
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    try:
+        with open(CGROUP_V2_CPU_MAX) as f:
+            quota, period = f.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        quota, period = read_number(CGROUP_V1_CPU_QUOTA), read_number(CGROUP_V1_CPU_PERIOD)
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def available_cpus() -> int:
+    if settings.worker_cpus:
+        return settings.worker_cpus
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # os.cpu_count() ignores container limits; a fractional quota is rounded down
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(int(quota), 1))
+    return cpus
+
+
+def cpu_layout(cpus: int, threads: int) -> tuple[int, int]:
+    threads = min(max(threads, 1), cpus)
+    return max(cpus // threads, 1), threads
+
+
+def process_counts(cpus: int) -> list[int]:
+    # every split of the CPUs into processes with an equal number of OCR threads each
+    return sorted({cpus // threads for threads in range(1, cpus + 1)})
+
+
+def configure_worker_concurrency(app) -> None:
+    # a concurrency given on the command line still wins; the thread limit then follows it
+    processes, _ = cpu_layout(available_cpus(), settings.ocr_threads_per_process)
+    app.conf.worker_concurrency = processes
+    if settings.worker_autoscale_enabled:
+        # the throughput tuner recycles pool processes when it changes the split
+        app.conf.worker_pool_restarts = True
+
+
+def set_ocr_thread_limit(processes: int, cpus: int) -> None:
+    ocr_thread_limit.value = max(cpus // max(processes, 1), 1)
+    WORKER_CPU_LAYOUT.labels(kind="processes").set(processes)
+    WORKER_CPU_LAYOUT.labels(kind="ocr_threads").set(ocr_thread_limit.value)
+
+
+@worker_init.connect
+def apply_cpu_layout(sender=None, **kwargs):
+    if settings.worker_cpu_mode != "auto":
+        return
+    set_ocr_thread_limit(sender.concurrency, available_cpus())
+
+
+@worker_ready.connect
+def log_cpu_layout(sender=None, **kwargs):
+    # logging is configured only after worker_init
+    if settings.worker_cpu_mode == "auto":
+        logger.info("Worker uses %s CPUs: %s pool processes, %s OCR threads each",
+                    available_cpus(), sender.pool.num_processes, ocr_thread_limit.value)
+
+
+@worker_process_init.connect
+@task_prerun.connect
+def apply_ocr_thread_limit(**kwargs):
+    # tesseract reads the limit when OpenMP starts: tesserocr once per pool process, pytesseract per call
+    if ocr_thread_limit.value:
+        os.environ[OCR_THREAD_LIMIT_ENV] = str(ocr_thread_limit.value)
+
+
+class ThroughputTuner(bootsteps.StartStopStep):
+    # hill-climbs the pool size over the process/thread splits of the CPUs, keeping a step
+    # only when it raises the number of tasks finished per second
+    label = "Throughput tuner"
+    requires = ("celery.worker.components:Pool",)
+
+    def __init__(self, w, **kwargs):
+        super().__init__(w, **kwargs)
+        self.enabled = settings.worker_cpu_mode == "auto" and settings.worker_autoscale_enabled \
+            and "prefork" in str(w.pool_cls)
+        self.cpus = available_cpus()
+        self.counts = process_counts(self.cpus)
+        self.index = None
+        self.direction = -1
+        self.baseline = None
+        self.failures = 0
+        self.hold = 0
+        self.settling = False
+        self.finished = 0
+        self.sampled_at = 0.0
+
+    def register_with_event_loop(self, w, hub):
+        current = w.pool.num_processes
+        self.index = min(range(len(self.counts)), key=lambda index: abs(self.counts[index] - current))
+        self.finished, self.sampled_at = self.finished_tasks(), time.monotonic()
+        hub.call_repeatedly(settings.worker_autoscale_interval, self.retune, w)
+
+    @staticmethod
+    def finished_tasks() -> int:
+        return state.all_total_count[0] - len(state.active_requests)
+
+    def retune(self, w) -> None:
+        self.resize(w)
+        now, finished = time.monotonic(), self.finished_tasks()
+        rate = (finished - self.finished) / (now - self.sampled_at)
+        self.finished, self.sampled_at = finished, now
+
+        if self.settling:
+            # the interval after a split change still ran tasks in processes with the old thread limit
+            self.settling = False
+            return
+
+        # a pool that ran out of work says nothing about the split, so only saturated intervals count
+        if len(state.reserved_requests) < w.pool.num_processes or w.pool.num_processes != self.counts[self.index]:
+            self.baseline = None
+            return
+        WORKER_TASK_RATE.set(rate)
+
+        if self.hold:
+            self.hold -= 1
+        elif self.baseline is None:
+            self.baseline = (self.index, rate)
+            if not self.move(w, self.index + self.direction):
+                self.direction = -self.direction
+                self.move(w, self.index + self.direction)
+        elif rate > self.baseline[1] * (1 + settings.worker_autoscale_min_gain):
+            self.baseline, self.failures = (self.index, rate), 0
+            if not self.move(w, self.index + self.direction):
+                self.baseline, self.hold = None, TUNER_HOLD_SAMPLES
+        else:
+            # worse or within noise: go back, and settle there once both neighbours were tried
+            self.move(w, self.baseline[0])
+            self.direction, self.baseline = -self.direction, None
+            self.failures += 1
+            if self.failures >= 2:
+                self.failures, self.hold = 0, TUNER_HOLD_SAMPLES
+                logger.info("Throughput tuner settled on %s processes at %.2f tasks/s", self.counts[self.index], rate)
+
+    def move(self, w, index: int) -> bool:
+        if not 0 <= index < len(self.counts):
+            return False
+        self.index = index
+        self.resize(w)
+        return True
+
+    def resize(self, w) -> None:
+        target, current = self.counts[self.index], w.pool.num_processes
+        if target > current:
+            w.pool.grow(target - current)
+        elif target < current:
+            try:
+                w.pool.shrink(current - target)
+            except ValueError:
+                # busy processes are not interrupted; the rest of the shrink is retried next interval
+                pass
+
+        resized = w.pool.num_processes
+        if resized != current:
+            # the same bookkeeping as the pool_grow and pool_shrink control commands, plus the
+            # semaphore that caps tasks in flight at the pool size
+            w.consumer._update_prefetch_count(resized - current)
+            if w.semaphore is not None:
+                if resized > current:
+                    w.semaphore.grow(resized - current)
+                else:
+                    w.semaphore.shrink(current - resized)
+            threads = ocr_thread_limit.value
+            set_ocr_thread_limit(resized, self.cpus)
+            if ocr_thread_limit.value != threads:
+                # processes read the limit when they start and tesserocr keeps its OpenMP runtime,
+                # so every process is replaced after its current task
+                w.pool.restart()
+                self.settling = True
+            logger.info("Throughput tuner resized the pool to %s processes, %s OCR threads each",
+                        resized, ocr_thread_limit.value)
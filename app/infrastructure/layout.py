@@ -0,0 +1,112 @@
+import struct
+
+import numpy as np
+
+from app.domain.entities import LayoutWord
+
+# Layout blob: header, page table, one packed little-endian array per word column and the
+# UTF-8 word texts addressed by an offsets array. Words are stored page by page, so a page
+# is a contiguous slice of every column and can be filtered without touching the others.
+LAYOUT_MAGIC = b"OCRL"
+LAYOUT_VERSION = 1
+LAYOUT_HEADER = struct.Struct("<4sIIII")
+PAGE_DTYPE = np.dtype([("page", "<u4"), ("first_word", "<u4"), ("width", "<u4"), ("height", "<u4")])
+WORD_COLUMNS = (
+    ("left", np.dtype("<i4")),
+    ("top", np.dtype("<i4")),
+    ("width", np.dtype("<i4")),
+    ("height", np.dtype("<i4")),
+    ("line", np.dtype("<u4")),
+    ("confidence", np.dtype("<f4")),
+)
+TEXT_OFFSET_DTYPE = np.dtype("<u4")
+
+
+def new_page_layout(page: int, width: int, height: int) -> dict:
+    # plain lists keep page results JSON-serializable between Celery tasks
+    layout = {"page": page, "page_width": width, "page_height": height, "words": []}
+    layout.update((name, []) for name, _ in WORD_COLUMNS)
+    return layout
+
+
+def encode_layout(pages: list[dict]) -> bytes:
+    pages = sorted(pages, key=lambda page: page["page"])
+    word_counts = [len(page["words"]) for page in pages]
+
+    page_table = np.empty(len(pages), dtype=PAGE_DTYPE)
+    page_table["page"] = [page["page"] for page in pages]
+    page_table["first_word"] = np.cumsum([0] + word_counts[:-1]) if pages else []
+    page_table["width"] = [page["page_width"] for page in pages]
+    page_table["height"] = [page["page_height"] for page in pages]
+
+    texts = [word.encode() for page in pages for word in page["words"]]
+    text_offsets = np.zeros(len(texts) + 1, dtype=TEXT_OFFSET_DTYPE)
+    np.cumsum([len(text) for text in texts], out=text_offsets[1:])
+
+    parts = [
+        LAYOUT_HEADER.pack(LAYOUT_MAGIC, LAYOUT_VERSION, len(pages), len(texts), int(text_offsets[-1])),
+        page_table.tobytes()
+    ]
+    for name, dtype in WORD_COLUMNS:
+        parts.append(np.array([value for page in pages for value in page[name]], dtype=dtype).tobytes())
+    parts.append(text_offsets.tobytes())
+    parts.extend(texts)
+    return b"".join(parts)
+
+
+class LayoutReader:
+    def __init__(self, blob: bytes):
+        # every array is a zero-copy view into the blob; nothing is decoded up front
+        self._buffer = memoryview(blob)
+        magic, version, page_count, word_count, text_size = LAYOUT_HEADER.unpack_from(self._buffer)
+        if magic != LAYOUT_MAGIC or version != LAYOUT_VERSION:
+            raise ValueError("Unsupported layout format")
+
+        offset = LAYOUT_HEADER.size
+        self.pages = np.frombuffer(self._buffer, PAGE_DTYPE, page_count, offset)
+        offset += self.pages.nbytes
+        self._columns = {}
+        for name, dtype in WORD_COLUMNS:
+            self._columns[name] = np.frombuffer(self._buffer, dtype, word_count, offset)
+            offset += word_count * dtype.itemsize
+        self._text_offsets = np.frombuffer(self._buffer, TEXT_OFFSET_DTYPE, word_count + 1, offset)
+        offset += self._text_offsets.nbytes
+        self._text = self._buffer[offset:offset + text_size]
+        self.word_count = word_count
+
+    def page(self, page_number: int) -> tuple[int, int, int, int]:
+        index = np.searchsorted(self.pages["page"], page_number)
+        if index == len(self.pages) or self.pages["page"][index] != page_number:
+            raise ValueError(f"Page {page_number} not found in layout")
+
+        entry = self.pages[index]
+        end = self.pages["first_word"][index + 1] if index + 1 < len(self.pages) else self.word_count
+        return int(entry["first_word"]), int(end), int(entry["width"]), int(entry["height"])
+
+    def words_in_rect(self, page_number: int, left: int, top: int, right: int, bottom: int,
+                      contained: bool = False) -> list[LayoutWord]:
+        start, end, _, _ = self.page(page_number)
+        word_left = self._columns["left"][start:end]
+        word_top = self._columns["top"][start:end]
+        word_right = word_left + self._columns["width"][start:end]
+        word_bottom = word_top + self._columns["height"][start:end]
+
+        if contained:
+            mask = (word_left >= left) & (word_top >= top) & (word_right <= right) & (word_bottom <= bottom)
+        else:
+            mask = (word_left < right) & (word_top < bottom) & (word_right > left) & (word_bottom > top)
+
+        # only the texts of the matching words are decoded
+        return [self.word(start + int(index)) for index in np.flatnonzero(mask)]
+
+    def word(self, index: int) -> LayoutWord:
+        text = bytes(self._text[self._text_offsets[index]:self._text_offsets[index + 1]]).decode()
+        return LayoutWord(
+            text=text,
+            left=int(self._columns["left"][index]),
+            top=int(self._columns["top"][index]),
+            width=int(self._columns["width"][index]),
+            height=int(self._columns["height"][index]),
+            line=int(self._columns["line"][index]),
+            confidence=float(self._columns["confidence"][index])
+        )
@@ -0,0 +1,160 @@
+import glob
+import os
+import time
+
+from celery.signals import before_task_publish, task_prerun, task_failure
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST, \
+    start_http_server
+from prometheus_client import multiprocess
+
+# with PROMETHEUS_MULTIPROC_DIR set (prefork workers, several uvicorn workers) every process
+# writes its samples to that directory and the exporter aggregates them on scrape
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+ENQUEUED_AT_HEADER = "enqueued_at"
+TASK_DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "ocr_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"]
+)
+UPLOADED_BYTES = Counter(
+    "ocr_uploaded_bytes",
+    "Bytes of uploaded documents stored",
+    ["content_type"]
+)
+CACHE_REQUESTS = Counter(
+    "ocr_cache_requests",
+    "In-process cache lookups by result (hit, miss, expired)",
+    ["cache", "result"]
+)
+CACHE_EVICTIONS = Counter(
+    "ocr_cache_evictions",
+    "Entries evicted from an in-process cache to stay within its bounds",
+    ["cache"]
+)
+TASK_QUEUE_WAIT = Histogram(
+    "ocr_task_queue_wait_seconds",
+    "Time between publishing a task and a worker starting it",
+    ["task", "queue"],
+    buckets=TASK_DURATION_BUCKETS
+)
+OCR_STAGE_DURATION = Histogram(
+    "ocr_stage_duration_seconds",
+    "Time spent in each OCR stage (rasterize, decode, preprocessing steps, ocr)",
+    ["stage"],
+    buckets=TASK_DURATION_BUCKETS
+)
+DB_WRITE_DURATION = Histogram(
+    "ocr_db_write_duration_seconds",
+    "Time spent storing extracted text",
+    buckets=TASK_DURATION_BUCKETS
+)
+OUTBOX_PUBLISHED = Counter(
+    "ocr_outbox_published",
+    "Analysis tasks published by the outbox relay"
+)
+OUTBOX_LAG = Histogram(
+    "ocr_outbox_lag_seconds",
+    "Time between committing an outbox message and publishing it",
+    buckets=TASK_DURATION_BUCKETS
+)
+ANALYSIS_BACKLOG = Gauge(
+    "ocr_analysis_backlog",
+    "Analyses claimed but not finished (pending) and messages waiting in the OCR queues (queued)",
+    ["source"],
+    multiprocess_mode="max"
+)
+ANALYSIS_THROUGHPUT = Gauge(
+    "ocr_analysis_throughput",
+    "Smoothed rate of finished analyses per second, as seen by admission control",
+    multiprocess_mode="max"
+)
+ADMISSION_REJECTED = Counter(
+    "ocr_admission_rejected",
+    "Analyze requests rejected with 429 by traffic class and the limit that was hit",
+    ["traffic_class", "reason"]
+)
+WORKER_CPU_LAYOUT = Gauge(
+    "ocr_worker_cpu_layout",
+    "Pool processes and OCR threads per process of the worker",
+    ["kind"],
+    multiprocess_mode="liveall"
+)
+WORKER_TASK_RATE = Gauge(
+    "ocr_worker_task_rate",
+    "Tasks finished per second by the worker over the last throughput tuner interval with a saturated pool",
+    multiprocess_mode="liveall"
+)
+RETENTION_DELETED = Counter(
+    "ocr_retention_deleted",
+    "Documents, their files and orphaned files removed by the retention job",
+    ["kind"]
+)
+TASK_FAILURES = Counter(
+    "ocr_task_failures",
+    "Failed Celery tasks by exception type",
+    ["task", "exception"]
+)
+
+
+def observe_stage_timings(timings: dict[str, float]) -> None:
+    for stage, seconds in timings.items():
+        OCR_STAGE_DURATION.labels(stage=stage).observe(seconds)
+
+
+def metrics_registry() -> CollectorRegistry | None:
+    if not MULTIPROC_DIR:
+        return None
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_payload() -> tuple[bytes, str]:
+    registry = metrics_registry()
+    if registry is None:
+        return generate_latest(), CONTENT_TYPE_LATEST
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def start_worker_exporter(port: int) -> None:
+    if MULTIPROC_DIR:
+        # samples left by a previous run would otherwise be summed into this one
+        for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+        start_http_server(port, registry=metrics_registry())
+    else:
+        start_http_server(port)
+
+
+def mark_process_dead(pid: int) -> None:
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(ENQUEUED_AT_HEADER, time.time())
+
+
+def queue_wait_seconds(request) -> float | None:
+    enqueued_at = getattr(request, ENQUEUED_AT_HEADER, None)
+    if enqueued_at is None:
+        return None
+    return max(time.time() - enqueued_at, 0.0)
+
+
+@task_prerun.connect
+def observe_queue_wait(task=None, **kwargs):
+    queue_wait = queue_wait_seconds(task.request)
+    if queue_wait is None:
+        return
+    queue = (task.request.delivery_info or {}).get("routing_key") or "unknown"
+    TASK_QUEUE_WAIT.labels(task=task.name, queue=queue).observe(queue_wait)
+
+
+@task_failure.connect
+def count_task_failure(sender=None, exception=None, **kwargs):
+    TASK_FAILURES.labels(task=sender.name, exception=type(exception).__name__).inc()
@@ -1,19 +1,58 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, BigInteger, Boolean, String, DateTime, ForeignKey, Text, Index, JSON, LargeBinary
+from sqlalchemy.orm import deferred
+from sqlalchemy.sql import func, literal_column
 from app.infrastructure.database import Base
 
 
 class DocumentModel(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        Index("ix_documents_upload_date_id", "upload_date", "id"),
+        # admission control counts pending analyses per client and recent requests
+        Index("ix_documents_analysis_pending_client", "analysis_client",
+              postgresql_where=literal_column("analysis_status = 'pending'")),
+        Index("ix_documents_analysis_requested_at", "analysis_requested_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     file_path = Column(String, nullable=False, unique=True)
-    upload_date = Column(DateTime(timezone=True), server_default=func.now())
+    upload_date = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    file_hash = Column(String(64), index=True)
+    file_size = Column(BigInteger)
+    content_type = Column(String(100))
+    page_count = Column(Integer)
+    analysis_status = Column(String(20))
+    analysis_task_id = Column(String(155))
+    analysis_requested_at = Column(DateTime(timezone=True))
+    analysis_client = Column(String(100))
 
 
 class DocumentTextModel(Base):
     __tablename__ = "document_text"
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
-    extracted_text = Column(Text, nullable=False)
\ No newline at end of file
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, unique=True, index=True)
+    extracted_text = Column(Text, nullable=False)
+    # per-stage timings and image details of the run that produced the text; not loaded with the text
+    diagnostics = deferred(Column(JSON))
+    # packed word boxes, see app.infrastructure.layout
+    layout = deferred(Column(LargeBinary))
+
+
+class TaskOutboxModel(Base):
+    __tablename__ = "task_outbox"
+
+    # analysis tasks committed together with their claim and published by the outbox relay
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    task_id = Column(String(155), nullable=False)
+    preprocessing = Column(JSON)
+    force = Column(Boolean, nullable=False, server_default="false")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+# document_text.search_vector is a generated tsvector column with a GIN index that
+# only the migrations define, so ORM loads of DocumentTextModel never fetch it
+DOCUMENT_TEXT_SEARCH_CONFIG = "simple"
+document_text_search_vector = literal_column("document_text.search_vector")
+MIGRATION_ONLY_OBJECTS = {"search_vector", "ix_document_text_search_vector"}
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
+import asyncpg
+from sqlalchemy import Integer, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app.application.interfaces import IDocumentTextNotifier
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_TEXT_CHANNEL = "document_text_ready"
+
+
+def document_text_notification(document_id: int):
+    # Postgres delivers the notification only when the surrounding transaction commits
+    return text("SELECT pg_notify(:channel, :payload)").bindparams(
+        channel=DOCUMENT_TEXT_CHANNEL,
+        payload=str(document_id)
+    )
+
+
+def document_text_notifications(document_ids: list[int]):
+    return text("SELECT pg_notify(:channel, document_id::text) FROM unnest(:document_ids) AS document_id").bindparams(
+        bindparam("document_ids", value=list(document_ids), type_=ARRAY(Integer)),
+        channel=DOCUMENT_TEXT_CHANNEL
+    )
+
+
+class PostgresDocumentTextListener(IDocumentTextNotifier):
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._connection = None
+        self._lock = None
+        self._waiters: dict[int, set[asyncio.Future]] = {}
+        self._observers: list[tuple[Callable[[int], None], Callable[[], None]]] = []
+        self._stopped = False
+        self._reconnect_task = None
+
+    def add_observer(self, on_notify: Callable[[int], None], on_reset: Callable[[], None]) -> None:
+        # on_reset runs whenever notifications may have been missed
+        self._observers.append((on_notify, on_reset))
+
+    async def start(self) -> None:
+        self._stopped = False
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._connection is not None and not self._connection.is_closed():
+                return
+            self._connection = await asyncpg.connect(self.dsn)
+            self._connection.add_termination_listener(self._on_terminate)
+            await self._connection.add_listener(DOCUMENT_TEXT_CHANNEL, self._on_notify)
+
+    async def stop(self) -> None:
+        self._stopped = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        connection, self._connection = self._connection, None
+        if connection is not None and not connection.is_closed():
+            await connection.close()
+        self._wake_all()
+
+    @asynccontextmanager
+    async def subscribe(self, document_id: int) -> AsyncIterator[asyncio.Future]:
+        await self.start()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(document_id, set()).add(waiter)
+        try:
+            yield waiter
+        finally:
+            waiters = self._waiters.get(document_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[document_id]
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            document_id = int(payload)
+        except ValueError:
+            return
+
+        for on_notify, _ in self._observers:
+            on_notify(document_id)
+        for waiter in self._waiters.pop(document_id, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _on_terminate(self, connection) -> None:
+        logger.warning("Notification listener connection closed")
+        if connection is self._connection:
+            self._connection = None
+        # waiters re-check the database instead of waiting for a notification that can no longer arrive
+        self._wake_all()
+        for _, on_reset in self._observers:
+            on_reset()
+        if self._observers:
+            self.schedule_reconnect()
+
+    def schedule_reconnect(self) -> None:
+        if not self._stopped and self._reconnect_task is None:
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        try:
+            while not self._stopped:
+                await asyncio.sleep(settings.notify_reconnect_delay)
+                try:
+                    await self.start()
+                except Exception as e:
+                    logger.warning("Notification listener reconnect failed: %s", e)
+                else:
+                    # anything committed while disconnected was not announced
+                    for _, on_reset in self._observers:
+                        on_reset()
+                    return
+        finally:
+            self._reconnect_task = None
+
+    def _wake_all(self) -> None:
+        waiters, self._waiters = self._waiters, {}
+        for document_waiters in waiters.values():
+            for waiter in document_waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+
+document_text_listener = PostgresDocumentTextListener(settings.database_url.replace("+asyncpg", ""))
@@ -0,0 +1,152 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+import pytesseract
+from PIL import Image
+
+from app.core.config import settings
+from app.infrastructure.layout import new_page_layout
+
+logger = logging.getLogger(__name__)
+
+pytesseract.pytesseract.tesseract_cmd = settings.tesseract_path
+
+
+WORD_LEVEL = 5
+
+
+def append_word(layout: dict, text: str, left: int, top: int, width: int, height: int, line: int,
+                confidence: float) -> None:
+    layout["words"].append(text)
+    layout["left"].append(left)
+    layout["top"].append(top)
+    layout["width"].append(width)
+    layout["height"].append(height)
+    layout["line"].append(line)
+    layout["confidence"].append(confidence)
+
+
+class PytesseractEngine:
+    name = "pytesseract"
+
+    def image_to_string(self, image: Image.Image) -> str:
+        return pytesseract.image_to_string(image, lang=settings.ocr_language)
+
+    def image_to_layout(self, image: Image.Image, page: int = 1) -> tuple[str, dict]:
+        # one tesseract run; the text is rebuilt from the word boxes the same way image_to_string lays it out
+        data = pytesseract.image_to_data(image, lang=settings.ocr_language, output_type=pytesseract.Output.DICT)
+        layout = new_page_layout(page, image.width, image.height)
+        paragraphs = []
+        lines = {}
+        for index, word in enumerate(data["text"]):
+            if data["level"][index] != WORD_LEVEL or not word.strip():
+                continue
+            paragraph_key = (data["block_num"][index], data["par_num"][index])
+            line_key = (*paragraph_key, data["line_num"][index])
+            if line_key not in lines:
+                lines[line_key] = []
+                if not paragraphs or paragraphs[-1][0] != paragraph_key:
+                    paragraphs.append((paragraph_key, []))
+                paragraphs[-1][1].append(lines[line_key])
+            lines[line_key].append(word)
+            append_word(layout, word, data["left"][index], data["top"][index], data["width"][index],
+                        data["height"][index], len(lines) - 1, float(data["conf"][index]))
+
+        text = "\n\n".join("\n".join(" ".join(line) for line in paragraph) for _, paragraph in paragraphs)
+        return text, layout
+
+    def close(self) -> None:
+        pass
+
+
+class TesserocrEngine:
+    name = "tesserocr"
+
+    def __init__(self, pool_size: int):
+        import tesserocr
+
+        options = {"lang": settings.ocr_language}
+        if settings.tessdata_path:
+            options["path"] = settings.tessdata_path
+
+        self._pool = queue.Queue()
+        for _ in range(max(pool_size, 1)):
+            self._pool.put(tesserocr.PyTessBaseAPI(**options))
+
+    @contextmanager
+    def _acquire(self):
+        api = self._pool.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            self._pool.put(api)
+
+    def image_to_string(self, image: Image.Image) -> str:
+        with self._acquire() as api:
+            api.SetImage(image)
+            return api.GetUTF8Text()
+
+    def image_to_layout(self, image: Image.Image, page: int = 1) -> tuple[str, dict]:
+        import tesserocr
+
+        layout = new_page_layout(page, image.width, image.height)
+        with self._acquire() as api:
+            api.SetImage(image)
+            api.Recognize()
+            # both the text and the word iterator read the results of the single Recognize call
+            text = api.GetUTF8Text()
+            level = tesserocr.RIL.WORD
+            line = -1
+            for word in tesserocr.iterate_level(api.GetIterator(), level):
+                if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                    line += 1
+                box = word.BoundingBox(level)
+                word_text = word.GetUTF8Text(level)
+                if box is None or not word_text or not word_text.strip():
+                    continue
+                left, top, right, bottom = box
+                append_word(layout, word_text, left, top, right - left, bottom - top, max(line, 0),
+                            word.Confidence(level))
+        return text, layout
+
+    def close(self) -> None:
+        while True:
+            try:
+                api = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            api.End()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def create_ocr_engine():
+    if settings.ocr_engine == "tesserocr":
+        try:
+            return TesserocrEngine(settings.ocr_engine_pool_size)
+        except Exception as e:
+            logger.warning("tesserocr engine unavailable, falling back to pytesseract: %s", e)
+    return PytesseractEngine()
+
+
+def get_ocr_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_ocr_engine()
+                logger.info("OCR engine %s initialised", _engine.name)
+    return _engine
+
+
+def shutdown_ocr_engine() -> None:
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.close()
+            _engine = None
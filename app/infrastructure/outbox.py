@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.application.interfaces import ITaskOutbox
+from app.core.config import settings
+from app.infrastructure.celery import celery_app
+from app.infrastructure.database import SyncSession
+from app.infrastructure.metrics import OUTBOX_LAG, OUTBOX_PUBLISHED
+from app.infrastructure.models import DocumentModel, TaskOutboxModel
+from app.infrastructure.repositories import to_document
+from app.infrastructure.services import CeleryWorkerService
+
+logger = logging.getLogger(__name__)
+
+TASK_OUTBOX_CHANNEL = "task_outbox"
+TASK_OUTBOX_NOTIFICATION = text("SELECT pg_notify(:channel, '')").bindparams(channel=TASK_OUTBOX_CHANNEL)
+# with publisher confirms every message waits for its own broker round-trip while the batch keeps
+# its rows locked, so a batch is capped at what one relay publishes in well under a second
+OUTBOX_MAX_BATCH_SIZE = 200
+
+
+class PostgresTaskOutbox(ITaskOutbox):
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add(self, task_ids: dict[int, str], preprocessing: Optional[dict] = None, force: bool = False) -> None:
+        # written into the caller's transaction; the relays are woken when it commits
+        await self.session.execute(insert(TaskOutboxModel.__table__).values([
+            {"document_id": document_id, "task_id": task_id, "preprocessing": preprocessing, "force": force}
+            for document_id, task_id in task_ids.items()
+        ]))
+        await self.session.execute(TASK_OUTBOX_NOTIFICATION)
+
+
+def pending_messages(limit: int):
+    # relays of several API processes share the table; each takes a batch nobody else holds
+    outbox = TaskOutboxModel.__table__
+    return select(
+        outbox.c.id.label("outbox_id"),
+        outbox.c.task_id,
+        outbox.c.preprocessing,
+        outbox.c.force,
+        outbox.c.created_at,
+        *DocumentModel.__table__.c
+    ) \
+        .join(DocumentModel.__table__, DocumentModel.__table__.c.id == outbox.c.document_id) \
+        .order_by(outbox.c.id) \
+        .limit(limit) \
+        .with_for_update(of=outbox, skip_locked=True)
+
+
+def publish_pending(limit: int) -> int:
+    outbox = TaskOutboxModel.__table__
+    with SyncSession() as session:
+        messages = session.execute(pending_messages(limit)).all()
+        if not messages:
+            return 0
+
+        published, dropped = [], []
+        try:
+            with celery_app.producer_or_acquire() as producer:
+                broker_errors = producer.connection.connection_errors + producer.connection.channel_errors
+                for message in messages:
+                    try:
+                        CeleryWorkerService.analysis_signature(
+                            to_document(message), message.preprocessing, message.task_id, message.force
+                        ).apply_async(producer=producer)
+                    except broker_errors:
+                        raise
+                    except Exception:
+                        # a message that cannot be built or serialized would block the relay on every
+                        # retry; its document is claimed again once the claim times out
+                        logger.exception("Dropping outbox message %s for document %s",
+                                         message.outbox_id, message.id)
+                        dropped.append(message)
+                    else:
+                        published.append(message)
+        finally:
+            # messages published before a broker error are not sent again
+            if published or dropped:
+                session.execute(delete(outbox).where(
+                    outbox.c.id.in_([message.outbox_id for message in published + dropped])
+                ))
+                session.commit()
+                observe_published(published)
+
+    return len(published)
+
+
+def observe_published(messages: list) -> None:
+    now = datetime.now(timezone.utc)
+    OUTBOX_PUBLISHED.inc(len(messages))
+    for message in messages:
+        OUTBOX_LAG.observe((now - message.created_at).total_seconds())
+
+
+class OutboxRelay:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._connection = None
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self.batch_size = min(settings.outbox_batch_size, OUTBOX_MAX_BATCH_SIZE)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        connection, self._connection = self._connection, None
+        if connection is not None and not connection.is_closed():
+            await connection.close()
+
+    async def _listen(self) -> None:
+        if self._connection is not None and not self._connection.is_closed():
+            return
+        try:
+            self._connection = await asyncpg.connect(self.dsn)
+            await self._connection.add_listener(TASK_OUTBOX_CHANNEL, self._on_notify)
+        except Exception as e:
+            # without notifications the relay still drains the outbox every poll interval
+            logger.warning("Outbox relay cannot listen for notifications: %s", e)
+            self._connection = None
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._listen()
+            self._wakeup.clear()
+            started = time.perf_counter()
+            try:
+                published = await asyncio.to_thread(publish_pending, self.batch_size)
+            except Exception as e:
+                logger.warning("Outbox relay failed to publish: %s", e)
+                await asyncio.sleep(settings.outbox_retry_delay)
+                continue
+
+            if published:
+                logger.debug("Outbox relay published %s tasks in %.1fms", published,
+                             (time.perf_counter() - started) * 1000)
+            if published < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.outbox_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+
+outbox_relay = OutboxRelay(settings.database_url.replace("+asyncpg", ""))
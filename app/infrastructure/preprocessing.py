@@ -0,0 +1,263 @@
+import math
+import time
+from dataclasses import dataclass, field, fields, replace
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+
+SAUVOLA_K = 0.2
+SAUVOLA_R = 128.0
+STRIP_ROWS = 256
+DESKEW_SAMPLE_SIDE = 1000
+BORDER_FILL_RATIO = 0.9
+CROP_PADDING = 10
+EXIF_ORIENTATION = 0x0112
+
+
+@dataclass
+class PreprocessingOptions:
+    enabled: bool
+    target_dpi: Optional[int]
+    max_side: Optional[int]
+    grayscale: bool
+    binarize: bool
+    binarize_window: int
+    deskew: bool
+    max_skew_angle: float
+    crop_borders: bool
+
+    @classmethod
+    def from_settings(cls, overrides: Optional[dict] = None) -> "PreprocessingOptions":
+        options = cls(
+            enabled=settings.preprocess_enabled,
+            target_dpi=settings.preprocess_target_dpi,
+            max_side=settings.preprocess_max_side,
+            grayscale=settings.preprocess_grayscale,
+            binarize=settings.preprocess_binarize,
+            binarize_window=settings.preprocess_binarize_window,
+            deskew=settings.preprocess_deskew,
+            max_skew_angle=settings.preprocess_max_skew_angle,
+            crop_borders=settings.preprocess_crop_borders,
+        )
+        names = {field.name for field in fields(cls)}
+        return replace(options, **{key: value for key, value in (overrides or {}).items() if key in names})
+
+
+@dataclass
+class PageGeometry:
+    # the resizing, rotation and cropping done by preprocessing, in order; each step keeps the size
+    # of the image it was applied to, so boxes found by OCR can be mapped back through it
+    steps: list[tuple] = field(default_factory=list)
+
+    @property
+    def source_size(self) -> Optional[tuple[int, int]]:
+        return self.steps[0][1] if self.steps else None
+
+    def to_source(self, left, top, width, height) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        x0 = np.asarray(left, dtype=np.float64)
+        y0 = np.asarray(top, dtype=np.float64)
+        x1 = x0 + np.asarray(width, dtype=np.float64)
+        y1 = y0 + np.asarray(height, dtype=np.float64)
+
+        for kind, size, *args in reversed(self.steps):
+            if kind == "crop":
+                offset_x, offset_y = args[0]
+                x0, x1, y0, y1 = x0 + offset_x, x1 + offset_x, y0 + offset_y, y1 + offset_y
+            elif kind == "scale":
+                scale_x, scale_y = size[0] / args[0][0], size[1] / args[0][1]
+                x0, x1, y0, y1 = x0 * scale_x, x1 * scale_x, y0 * scale_y, y1 * scale_y
+            elif kind == "rotate":
+                # the inverse of Image.rotate(expand=True): rotated pixels map back around both centers,
+                # and a box becomes the bounding box of its rotated corners
+                (rotated_width, rotated_height), angle = args
+                cos, sin = math.cos(-math.radians(angle)), math.sin(-math.radians(angle))
+                xs, ys = [], []
+                for x, y in ((x0, y0), (x1, y0), (x0, y1), (x1, y1)):
+                    dx, dy = x - rotated_width / 2, y - rotated_height / 2
+                    xs.append(cos * dx + sin * dy + size[0] / 2)
+                    ys.append(-sin * dx + cos * dy + size[1] / 2)
+                x0, x1, y0, y1 = np.min(xs, axis=0), np.max(xs, axis=0), np.min(ys, axis=0), np.max(ys, axis=0)
+
+        if self.steps:
+            width, height = self.source_size
+            x0, x1 = np.clip(np.floor(x0), 0, width), np.clip(np.ceil(x1), 0, width)
+            y0, y1 = np.clip(np.floor(y0), 0, height), np.clip(np.ceil(y1), 0, height)
+        x0, y0 = np.rint(x0).astype(np.int64), np.rint(y0).astype(np.int64)
+        return x0, y0, np.rint(x1).astype(np.int64) - x0, np.rint(y1).astype(np.int64) - y0
+
+
+def preprocess_image(image: Image.Image,
+                     options: PreprocessingOptions) -> tuple[Image.Image, dict[str, float], PageGeometry]:
+    timings = {}
+    geometry = PageGeometry()
+    if not options.enabled:
+        return image, timings, geometry
+
+    dpi = image.info.get("dpi")
+    steps = [
+        ("orient", True, _orient),
+        ("downscale", bool(options.target_dpi or options.max_side), lambda img: _downscale(img, options, geometry)),
+        ("grayscale", options.grayscale or options.binarize or options.deskew, _grayscale),
+        ("deskew", options.deskew, lambda img: _deskew(img, options.max_skew_angle, geometry)),
+        ("binarize", options.binarize, lambda img: _binarize(img, options.binarize_window)),
+        ("crop_borders", options.crop_borders, lambda img: _crop_borders(img, geometry)),
+    ]
+    for name, enabled, step in steps:
+        if not enabled:
+            continue
+        started = time.perf_counter()
+        result = step(image)
+        timings[name] = time.perf_counter() - started
+        if result is not image:
+            if "dpi" in result.info:
+                dpi = result.info["dpi"]
+            elif dpi:
+                result.info["dpi"] = dpi
+            image = result
+
+    return image, timings, geometry
+
+
+def _orient(image: Image.Image) -> Image.Image:
+    if image.getexif().get(EXIF_ORIENTATION, 1) == 1:
+        return image
+    return ImageOps.exif_transpose(image)
+
+
+def _downscale(image: Image.Image, options: PreprocessingOptions, geometry: PageGeometry) -> Image.Image:
+    scale = 1.0
+    dpi = image.info.get("dpi")
+    if options.target_dpi and dpi and dpi[0] and float(dpi[0]) > options.target_dpi:
+        scale = options.target_dpi / float(dpi[0])
+
+    longest_side = max(image.size)
+    if options.max_side and longest_side * scale > options.max_side:
+        scale = options.max_side / longest_side
+
+    if scale >= 1.0:
+        return image
+
+    size = (max(round(image.width * scale), 1), max(round(image.height * scale), 1))
+    resized = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    geometry.steps.append(("scale", image.size, resized.size))
+    if dpi and dpi[0]:
+        resized.info["dpi"] = (float(dpi[0]) * scale, float(dpi[1]) * scale)
+    return resized
+
+
+def _grayscale(image: Image.Image) -> Image.Image:
+    if image.mode == "L":
+        return image
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return image.convert("L")
+
+
+def _otsu_threshold(gray: np.ndarray) -> int:
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = histogram.sum()
+    if not total:
+        return 128
+
+    levels = np.arange(256, dtype=np.float64)
+    weight_background = np.cumsum(histogram)
+    weight_foreground = total - weight_background
+    cumulative_mean = np.cumsum(histogram * levels)
+    mean_background = cumulative_mean / np.maximum(weight_background, 1)
+    mean_foreground = (cumulative_mean[-1] - cumulative_mean) / np.maximum(weight_foreground, 1)
+    between_variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+    return int(np.argmax(between_variance))
+
+
+def _binarize(image: Image.Image, window: int) -> Image.Image:
+    # Sauvola thresholding; local statistics come from integral images
+    # computed strip by strip so memory stays proportional to the image width
+    gray = np.asarray(_grayscale(image), dtype=np.uint8)
+    height, width = gray.shape
+    half = max(window, 3) // 2
+    binary = np.empty((height, width), dtype=np.uint8)
+
+    columns = np.arange(width)
+    x0 = np.clip(columns - half, 0, width)
+    x1 = np.clip(columns + half + 1, 0, width)
+
+    for top in range(0, height, STRIP_ROWS):
+        bottom = min(top + STRIP_ROWS, height)
+        lo = max(top - half, 0)
+        hi = min(bottom + half, height)
+
+        block = gray[lo:hi].astype(np.float64)
+        integral = np.zeros((hi - lo + 1, width + 1))
+        integral[1:, 1:] = block.cumsum(axis=0).cumsum(axis=1)
+        integral_sq = np.zeros((hi - lo + 1, width + 1))
+        integral_sq[1:, 1:] = (block * block).cumsum(axis=0).cumsum(axis=1)
+
+        rows = np.arange(top, bottom)
+        y0 = (np.clip(rows - half, 0, height) - lo)[:, None]
+        y1 = (np.clip(rows + half + 1, 0, height) - lo)[:, None]
+        area = (y1 - y0) * (x1 - x0)[None, :]
+
+        window_sum = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        window_sq = integral_sq[y1, x1] - integral_sq[y0, x1] - integral_sq[y1, x0] + integral_sq[y0, x0]
+        mean = window_sum / area
+        std = np.sqrt(np.maximum(window_sq / area - mean * mean, 0.0))
+        threshold = mean * (1.0 + SAUVOLA_K * (std / SAUVOLA_R - 1.0))
+
+        binary[top:bottom] = np.where(gray[top:bottom] > threshold, 255, 0)
+
+    return Image.fromarray(binary, mode="L")
+
+
+def _deskew(image: Image.Image, max_angle: float, geometry: PageGeometry) -> Image.Image:
+    sample = _grayscale(image)
+    factor = math.ceil(max(sample.size) / DESKEW_SAMPLE_SIDE)
+    if factor > 1:
+        sample = sample.reduce(factor)
+    gray = np.asarray(sample, dtype=np.uint8)
+    ink = np.where(gray < _otsu_threshold(gray), 255, 0).astype(np.uint8)
+    ink_image = Image.fromarray(ink, mode="L")
+
+    def score(angle: float) -> float:
+        rotated = np.asarray(ink_image.rotate(angle, resample=Image.Resampling.NEAREST, expand=True), dtype=np.float64)
+        return float(np.var(rotated.sum(axis=1)))
+
+    coarse = np.arange(-max_angle, max_angle + 0.5, 0.5)
+    best = max(coarse, key=score)
+    fine = np.arange(best - 0.5, best + 0.55, 0.1)
+    angle = float(max(fine, key=score))
+
+    if abs(angle) < 0.1:
+        return image
+    rotated = image.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+    geometry.steps.append(("rotate", image.size, rotated.size, angle))
+    return rotated
+
+
+def _crop_borders(image: Image.Image, geometry: PageGeometry) -> Image.Image:
+    gray = np.asarray(_grayscale(image), dtype=np.uint8)
+    ink = gray < _otsu_threshold(gray)
+
+    ink[ink.mean(axis=1) > BORDER_FILL_RATIO, :] = False
+    ink[:, ink.mean(axis=0) > BORDER_FILL_RATIO] = False
+
+    height, width = ink.shape
+    rows = np.flatnonzero(ink.sum(axis=1) > max(2, width // 1000))
+    columns = np.flatnonzero(ink.sum(axis=0) > max(2, height // 1000))
+    if not rows.size or not columns.size:
+        return image
+
+    box = (
+        max(int(columns[0]) - CROP_PADDING, 0),
+        max(int(rows[0]) - CROP_PADDING, 0),
+        min(int(columns[-1]) + CROP_PADDING + 1, width),
+        min(int(rows[-1]) + CROP_PADDING + 1, height),
+    )
+    if box == (0, 0, width, height):
+        return image
+    geometry.steps.append(("crop", image.size, box[:2]))
+    return image.crop(box)
@@ -1,50 +1,226 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text, delete
-import os
+from sqlalchemy import select, text, delete, func, tuple_, update, bindparam, or_, and_, literal, true, Integer, String
+from sqlalchemy.dialects.postgresql import insert, ARRAY
+from datetime import datetime, timedelta, timezone
 
-from app.domain.entities import Document, DocumentText, HealthStatus
+from app.core.config import settings
+from app.domain.entities import Document, DocumentText, DocumentDiagnostics, StoredFile, HealthStatus, DocumentSearchHit, \
+    DocumentListItem, ANALYSIS_PENDING, ANALYSIS_COMPLETED, ANALYSIS_FAILED
 from app.application.interfaces import IDocumentRepository, IHealthCheckRepository
-from app.infrastructure.models import DocumentModel, DocumentTextModel
+from app.infrastructure.models import DocumentModel, DocumentTextModel, DOCUMENT_TEXT_SEARCH_CONFIG, \
+    document_text_search_vector
+from app.infrastructure.notifications import document_text_notification
+
+
+def to_document(document: DocumentModel) -> Document:
+    return Document(
+        id=document.id,
+        file_path=document.file_path,
+        upload_date=document.upload_date,
+        file_hash=document.file_hash,
+        file_size=document.file_size,
+        content_type=document.content_type,
+        page_count=document.page_count,
+        analysis_status=document.analysis_status,
+        analysis_task_id=document.analysis_task_id,
+        analysis_requested_at=document.analysis_requested_at
+    )
+
+
+def document_text_upsert(document_id: int, extracted_text: str, diagnostics: dict | None = None,
+                         layout: bytes | None = None):
+    return document_texts_upsert([
+        {"document_id": document_id, "extracted_text": extracted_text, "diagnostics": diagnostics, "layout": layout}
+    ])
+
+
+def document_texts_upsert(rows: list[dict]):
+    return on_text_conflict_update(insert(DocumentTextModel).values(rows))
+
+
+def on_text_conflict_update(statement):
+    # a re-analysis replaces the layout as well, so words never outlive the text they were read from
+    return statement.on_conflict_do_update(
+        index_elements=[DocumentTextModel.document_id],
+        set_={
+            "extracted_text": statement.excluded.extracted_text,
+            "diagnostics": statement.excluded.diagnostics,
+            "layout": statement.excluded.layout
+        }
+    )
+
+
+# executed with a list of {"completed_document_id", "completed_task_id"} parameter sets; a task superseded
+# by a forced re-analysis leaves the newer claim alone
+DOCUMENT_ANALYSIS_COMPLETED = update(DocumentModel.__table__) \
+    .where(
+        DocumentModel.__table__.c.id == bindparam("completed_document_id"),
+        or_(
+            DocumentModel.__table__.c.analysis_task_id == bindparam("completed_task_id"),
+            DocumentModel.__table__.c.analysis_task_id.is_(None)
+        )
+    ) \
+    .values(analysis_status=ANALYSIS_COMPLETED)
+
+
+def document_analysis_failed(document_id: int, task_id: str):
+    return update(DocumentModel.__table__) \
+        .where(
+            DocumentModel.__table__.c.id == document_id,
+            DocumentModel.__table__.c.analysis_task_id == task_id,
+            DocumentModel.__table__.c.analysis_status == ANALYSIS_PENDING
+        ) \
+        .values(analysis_status=ANALYSIS_FAILED)
 
 
 class PostgresDocumentRepository(IDocumentRepository):
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def save_document(self, file_path: str) -> Document:
-        document = DocumentModel(file_path=file_path)
+    async def save_document(self, stored_file: StoredFile) -> Document:
+        document = DocumentModel(
+            file_path=stored_file.file_path,
+            file_hash=stored_file.file_hash,
+            file_size=stored_file.file_size,
+            content_type=stored_file.content_type,
+            page_count=stored_file.page_count
+        )
         self.session.add(document)
         await self.session.commit()
         await self.session.refresh(document)
-        return Document(
-            id=document.id,
-            file_path=document.file_path,
-            upload_date=document.upload_date
+        return to_document(document)
+
+    async def save_documents(self, stored_files: list[StoredFile]) -> list[Document]:
+        # one multi-row INSERT ... RETURNING and one commit for the whole batch
+        documents = DocumentModel.__table__
+        result = await self.session.execute(
+            insert(documents)
+            .values([
+                {
+                    "file_path": stored_file.file_path,
+                    "file_hash": stored_file.file_hash,
+                    "file_size": stored_file.file_size,
+                    "content_type": stored_file.content_type,
+                    "page_count": stored_file.page_count
+                }
+                for stored_file in stored_files
+            ])
+            .returning(*documents.c)
         )
+        rows = {row.file_path: row for row in result}
+        await self.session.commit()
+        return [to_document(rows[stored_file.file_path]) for stored_file in stored_files]
 
     async def get_document(self, document_id: int) -> Document | None:
         result = await self.session.execute(
-            select(DocumentModel).where(DocumentModel.id == document_id)
+            select(DocumentModel)
+            .where(DocumentModel.id == document_id)
+            .execution_options(populate_existing=True)
         )
         document = result.scalar_one_or_none()
         if document:
-            return Document(
-                id=document.id,
-                file_path=document.file_path,
-                upload_date=document.upload_date
-            )
+            return to_document(document)
         return None
 
-    async def save_extracted_text(self, document_id: int, text: str) -> DocumentText:
-        doc_text = DocumentTextModel(document_id=document_id, extracted_text=text)
-        self.session.add(doc_text)
+    async def get_documents(self, document_ids: list[int]) -> list[Document]:
+        result = await self.session.execute(
+            select(DocumentModel)
+            .where(DocumentModel.id.in_(document_ids))
+            .execution_options(populate_existing=True)
+        )
+        return [to_document(document) for document in result.scalars()]
+
+    async def claim_analyses(self, task_ids: dict[int, str], force: bool = False, commit: bool = True,
+                             client: str | None = None) -> set[int]:
+        # one UPDATE takes the claim for every document that has no live analysis; concurrent
+        # requests for the same row serialize on its lock and re-check the condition
+        documents = DocumentModel.__table__
+        claims = select(
+            func.unnest(bindparam("claim_document_ids", list(task_ids), type_=ARRAY(Integer))).label("document_id"),
+            func.unnest(bindparam("claim_task_ids", list(task_ids.values()), type_=ARRAY(String))).label("task_id")
+        ).subquery("claims")
+        statement = update(documents) \
+            .where(documents.c.id == claims.c.document_id) \
+            .values(
+                analysis_status=ANALYSIS_PENDING,
+                analysis_task_id=claims.c.task_id,
+                analysis_requested_at=func.now(),
+                analysis_client=client
+            ) \
+            .returning(documents.c.id)
+        if not force:
+            stale_before = datetime.now(timezone.utc) - timedelta(seconds=settings.analysis_claim_timeout)
+            statement = statement.where(or_(
+                documents.c.analysis_status.is_(None),
+                documents.c.analysis_status == ANALYSIS_FAILED,
+                and_(
+                    documents.c.analysis_status == ANALYSIS_PENDING,
+                    documents.c.analysis_requested_at < stale_before
+                )
+            ))
+
+        result = await self.session.execute(statement)
+        claimed = set(result.scalars())
+        if commit:
+            await self.session.commit()
+        return claimed
+
+    async def release_analyses(self, task_ids: dict[int, str]) -> None:
+        documents = DocumentModel.__table__
+        await self.session.execute(
+            update(documents)
+            .where(tuple_(documents.c.id, documents.c.analysis_task_id).in_(list(task_ids.items())))
+            .values(analysis_status=None, analysis_task_id=None, analysis_requested_at=None)
+        )
         await self.session.commit()
-        await self.session.refresh(doc_text)
-        return DocumentText(
-            id=doc_text.id,
-            document_id=doc_text.document_id,
-            extracted_text=doc_text.extracted_text
+
+    async def list_documents(self, limit: int, after: tuple[datetime, int] | None = None,
+                             analyzed: bool | None = None,
+                             uploaded_since: datetime | None = None) -> list[DocumentListItem]:
+        is_analyzed = DocumentTextModel.document_id.is_not(None)
+        statement = (
+            select(DocumentModel.id, DocumentModel.file_path, DocumentModel.upload_date, is_analyzed.label("analyzed"))
+            .outerjoin(DocumentTextModel, DocumentTextModel.document_id == DocumentModel.id)
+            .order_by(DocumentModel.upload_date, DocumentModel.id)
+            .limit(limit)
         )
+        if after is not None:
+            statement = statement.where(tuple_(DocumentModel.upload_date, DocumentModel.id) > tuple_(*after))
+        if uploaded_since is not None:
+            statement = statement.where(DocumentModel.upload_date >= uploaded_since)
+        if analyzed is not None:
+            statement = statement.where(is_analyzed if analyzed else DocumentTextModel.document_id.is_(None))
+
+        result = await self.session.execute(statement)
+        return [
+            DocumentListItem(
+                id=row.id,
+                file_path=row.file_path,
+                upload_date=row.upload_date,
+                analyzed=row.analyzed
+            )
+            for row in result
+        ]
+
+    async def copy_extracted_text(self, source_document_id: int, document_id: int) -> bool:
+        source = select(literal(document_id), DocumentTextModel.extracted_text, DocumentTextModel.layout) \
+            .where(DocumentTextModel.document_id == source_document_id)
+        result = await self.session.execute(on_text_conflict_update(
+            insert(DocumentTextModel).from_select(["document_id", "extracted_text", "layout"], source)
+        ).returning(DocumentTextModel.id))
+        if result.scalar_one_or_none() is None:
+            # the source text was deleted in the meantime
+            await self.session.rollback()
+            return False
+
+        await self.session.execute(
+            update(DocumentModel.__table__)
+            .where(DocumentModel.__table__.c.id == document_id)
+            .values(analysis_status=ANALYSIS_COMPLETED, analysis_task_id=None)
+        )
+        await self.session.execute(document_text_notification(document_id))
+        await self.session.commit()
+        return True
 
     async def get_text_by_document(self, document_id: int) -> DocumentText | None:
         result = await self.session.execute(
@@ -59,26 +235,109 @@ class PostgresDocumentRepository(IDocumentRepository):
             )
         return None
 
-    async def delete_document(self, document_id: int) -> bool:
-        document = await self.get_document(document_id)
-        if not document:
-            return False
+    async def get_layout(self, document_id: int) -> bytes | None:
+        result = await self.session.execute(
+            select(DocumentTextModel.layout).where(DocumentTextModel.document_id == document_id)
+        )
+        return result.scalar_one_or_none()
 
-        await self.session.execute(
-            delete(DocumentTextModel).where(DocumentTextModel.document_id == document_id)
+    async def get_diagnostics(self, document_id: int) -> DocumentDiagnostics | None:
+        result = await self.session.execute(
+            select(DocumentTextModel.document_id, DocumentTextModel.diagnostics)
+            .where(DocumentTextModel.document_id == document_id)
         )
+        row = result.one_or_none()
+        if row:
+            return DocumentDiagnostics(document_id=row.document_id, diagnostics=row.diagnostics)
+        return None
 
-        await self.session.execute(
-            delete(DocumentModel).where(DocumentModel.id == document_id)
+    async def get_text_by_file_hash(self, file_hash: str) -> DocumentText | None:
+        result = await self.session.execute(
+            select(DocumentTextModel)
+            .join(DocumentModel, DocumentModel.id == DocumentTextModel.document_id)
+            .where(DocumentModel.file_hash == file_hash)
+            .where(DocumentTextModel.layout.is_not(None) if settings.ocr_layout_enabled else true())
+            .limit(1)
+        )
+        doc_text = result.scalar_one_or_none()
+        if doc_text:
+            return DocumentText(
+                id=doc_text.id,
+                document_id=doc_text.document_id,
+                extracted_text=doc_text.extracted_text
+            )
+        return None
+
+    async def search_text(self, query: str, limit: int, offset: int) -> tuple[list[DocumentSearchHit], bool]:
+        ts_query = func.websearch_to_tsquery(DOCUMENT_TEXT_SEARCH_CONFIG, query)
+        # very common terms would force a rank over millions of rows, so only the most recent
+        # search_rank_candidates matches are ranked; the caller is told when the cap was reached
+        candidates = (
+            select(DocumentTextModel.document_id, document_text_search_vector.label("search_vector"))
+            .where(document_text_search_vector.op("@@")(ts_query))
+            .order_by(DocumentTextModel.document_id.desc())
+            .limit(settings.search_rank_candidates)
+            .subquery()
         )
+        rank = func.ts_rank_cd(candidates.c.search_vector, ts_query)
+        page = (
+            select(candidates.c.document_id, rank.label("rank"), func.count().over().label("matches"))
+            .order_by(rank.desc(), candidates.c.document_id)
+            .limit(limit)
+            .offset(offset)
+            .subquery()
+        )
+        # the text is only read back to build headlines for the returned page
+        result = await self.session.execute(
+            select(
+                page.c.document_id,
+                page.c.rank,
+                page.c.matches,
+                func.ts_headline(
+                    DOCUMENT_TEXT_SEARCH_CONFIG, DocumentTextModel.extracted_text, ts_query,
+                    settings.search_headline_options
+                ).label("snippet")
+            )
+            .join(DocumentTextModel, DocumentTextModel.document_id == page.c.document_id)
+            .order_by(page.c.rank.desc(), page.c.document_id)
+        )
+        rows = result.all()
+        hits = [
+            DocumentSearchHit(
+                document_id=row.document_id,
+                rank=row.rank,
+                snippet=row.snippet
+            )
+            for row in rows
+        ]
+        if rows:
+            matches = rows[0].matches
+        elif offset:
+            # a page past the last match carries no count, so the candidates are counted on their own
+            matches = await self.session.scalar(select(func.count()).select_from(candidates))
+        else:
+            matches = 0
+        return hits, matches >= settings.search_rank_candidates
+
+    async def delete_document(self, document_id: int) -> str | None:
+        # the text row goes with the document through ON DELETE CASCADE
+        result = await self.session.execute(
+            delete(DocumentModel.__table__)
+            .where(DocumentModel.__table__.c.id == document_id)
+            .returning(DocumentModel.__table__.c.file_path)
+        )
+        file_path = result.scalar_one_or_none()
+        if file_path is None:
+            await self.session.rollback()
+            return None
+
+        # other API processes drop their cached copy of the text
+        await self.session.execute(document_text_notification(document_id))
         await self.session.commit()
+        return file_path
 
-        try:
-            if os.path.exists(document.file_path):
-                os.remove(document.file_path)
-            return True
-        except OSError:
-            return False
+    async def commit(self) -> None:
+        await self.session.commit()
 
 
 class PostgresHealthCheckRepository(IHealthCheckRepository):
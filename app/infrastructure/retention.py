@@ -0,0 +1,119 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import delete, select
+
+from app.application.interfaces import IDocumentStorage
+from app.core.config import settings
+from app.infrastructure.database import SyncSession
+from app.infrastructure.metrics import RETENTION_DELETED
+from app.infrastructure.models import DocumentModel
+from app.infrastructure.notifications import document_text_notifications
+
+logger = logging.getLogger(__name__)
+
+
+def expired_documents_delete(cutoff: datetime, limit: int):
+    # the oldest batch is picked through the (upload_date, id) index; rows locked by a
+    # concurrent run or a delete request are skipped rather than waited for
+    documents = DocumentModel.__table__
+    expired = select(documents.c.id) \
+        .where(documents.c.upload_date < cutoff) \
+        .order_by(documents.c.upload_date, documents.c.id) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True)
+    return delete(documents) \
+        .where(documents.c.id.in_(expired.scalar_subquery())) \
+        .returning(documents.c.id, documents.c.file_path)
+
+
+def remove_files(storage: IDocumentStorage, keys: list[str], executor: ThreadPoolExecutor) -> int:
+    return sum(executor.map(storage.remove, keys))
+
+
+def batches(items: Iterable, size: int) -> Iterable[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class RetentionRun:
+    def __init__(self, storage: IDocumentStorage, progress: Optional[Callable[[dict], None]] = None):
+        self.storage = storage
+        self.progress = progress
+        self.started = time.monotonic()
+        self.report = {
+            "documents_deleted": 0,
+            "files_deleted": 0,
+            "orphans_scanned": 0,
+            "orphans_deleted": 0,
+            "batches": 0,
+        }
+
+    def run(self) -> dict:
+        with ThreadPoolExecutor(max_workers=max(settings.retention_delete_concurrency, 1)) as executor:
+            if settings.retention_days is not None:
+                self.delete_expired(executor)
+            if settings.retention_orphan_cleanup:
+                self.delete_orphans(executor)
+
+        self.report_progress()
+        logger.info("Retention run finished: %s", self.report)
+        return self.report
+
+    def delete_expired(self, executor: ThreadPoolExecutor) -> None:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.retention_days)
+        for _ in range(settings.retention_max_batches):
+            with SyncSession() as session:
+                rows = session.execute(expired_documents_delete(cutoff, settings.retention_batch_size)).all()
+                if not rows:
+                    return
+                session.execute(document_text_notifications([row.id for row in rows]))
+                session.commit()
+
+            # files are removed only after the rows are gone; a crash in between leaves
+            # orphans that the orphan sweep picks up
+            files_deleted = remove_files(self.storage, [row.file_path for row in rows], executor)
+            self.count("documents", len(rows))
+            self.count("files", files_deleted)
+            self.report["batches"] += 1
+            self.report_progress()
+
+            if len(rows) < settings.retention_batch_size:
+                return
+
+        logger.info("Retention stopped after %s batches; the rest is left for the next run",
+                    settings.retention_max_batches)
+
+    def delete_orphans(self, executor: ThreadPoolExecutor) -> None:
+        # recent files may belong to an upload whose row is not committed yet
+        modified_before = time.time() - settings.retention_orphan_min_age
+        candidates = (key for key, modified in self.storage.iter_keys() if modified < modified_before)
+        documents = DocumentModel.__table__
+        for keys in batches(candidates, settings.retention_batch_size):
+            with SyncSession() as session:
+                known = set(session.execute(
+                    select(documents.c.file_path).where(documents.c.file_path.in_(keys))
+                ).scalars())
+
+            orphans = [key for key in keys if key not in known]
+            self.report["orphans_scanned"] += len(keys)
+            self.count("orphans", remove_files(self.storage, orphans, executor))
+            self.report_progress()
+
+    def count(self, kind: str, amount: int) -> None:
+        self.report[f"{kind}_deleted"] += amount
+        RETENTION_DELETED.labels(kind=kind).inc(amount)
+
+    def report_progress(self) -> None:
+        elapsed = time.monotonic() - self.started
+        self.report["elapsed"] = elapsed
+        self.report["documents_per_second"] = self.report["documents_deleted"] / elapsed if elapsed else 0.0
+        self.report["files_per_second"] = \
+            (self.report["files_deleted"] + self.report["orphans_deleted"]) / elapsed if elapsed else 0.0
+        if self.progress is not None:
+            self.progress(dict(self.report))
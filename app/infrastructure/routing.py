@@ -0,0 +1,14 @@
+from app.core.config import settings
+from app.domain.entities import Document
+
+
+def classify_document(document: Document) -> str:
+    if document.file_size is not None and document.file_size > settings.ocr_small_max_bytes:
+        return settings.ocr_large_queue
+
+    if document.content_type == "application/pdf":
+        # a PDF whose page count could not be read is treated as large
+        if document.page_count is None or document.page_count > settings.ocr_small_max_pages:
+            return settings.ocr_large_queue
+
+    return settings.ocr_small_queue
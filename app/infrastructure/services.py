@@ -1,26 +1,118 @@
+import asyncio
+import logging
+
 import pika
-from celery.result import AsyncResult
+from celery import group
+from celery.result import AsyncResult, GroupResult
+from kombu.utils.uuid import uuid
 import pytesseract
-from pika import ConnectionParameters, BlockingConnection
+from pika import BlockingConnection
 
 from app.application.interfaces import IAsyncWorker
 from app.infrastructure.celery import celery_app
-from app.infrastructure.tasks import process_document_task
+from app.infrastructure.routing import classify_document
+from app.infrastructure.tasks import process_document_task, mark_analysis_failed_task
 from app.core.config import settings
-from app.domain.entities import HealthStatus
+from app.domain.entities import HealthStatus, AnalysisBatch, Document
+
+logger = logging.getLogger(__name__)
 
 
 class CeleryWorkerService(IAsyncWorker):
-    async def analyze_document(self, document_id: int) -> str:
-        task = process_document_task.apply_async(args=[document_id])
+    async def analyze_document(self, document: Document, preprocessing: dict | None = None,
+                               task_id: str | None = None, force: bool = False) -> str:
+        # publishing blocks on the broker; a stalled broker must not hold up the event loop
+        return await asyncio.to_thread(self._publish, document, preprocessing, task_id, force)
+
+    @classmethod
+    def _publish(cls, document: Document, preprocessing: dict | None, task_id: str | None, force: bool) -> str:
+        with celery_app.producer_or_acquire() as producer:
+            task = cls.analysis_signature(document, preprocessing, task_id, force).apply_async(producer=producer)
         return task.id
 
+    async def analyze_documents(self, documents: list[Document], preprocessing: dict | None = None,
+                                task_ids: dict[int, str] | None = None, force: bool = False) -> AnalysisBatch:
+        return await asyncio.to_thread(self._publish_group, documents, preprocessing, task_ids or {}, force)
+
+    @staticmethod
+    def analysis_signature(document: Document, preprocessing: dict | None, task_id: str | None, force: bool):
+        task_id = task_id or uuid()
+        return process_document_task \
+            .s(document.id, preprocessing=preprocessing, force=force) \
+            .set(task_id=task_id, queue=classify_document(document)) \
+            .on_error(mark_analysis_failed_task.si(document.id, task_id))
+
+    @classmethod
+    def _publish_group(cls, documents: list[Document], preprocessing: dict | None, task_ids: dict[int, str],
+                       force: bool) -> AnalysisBatch:
+        job = group(
+            cls.analysis_signature(document, preprocessing, task_ids.get(document.id), force)
+            for document in documents
+        )
+        with celery_app.producer_or_acquire() as producer:
+            group_result = job.apply_async(producer=producer)
+
+        try:
+            group_result.save()
+        except NotImplementedError:
+            pass
+
+        return AnalysisBatch(
+            group_id=group_result.id,
+            task_ids={
+                document.id: result.id
+                for document, result in zip(documents, group_result.results)
+            }
+        )
+
+    async def track_group(self, task_ids: dict[int, str]) -> AnalysisBatch:
+        return await asyncio.to_thread(self._save_group, task_ids)
+
+    @staticmethod
+    def _save_group(task_ids: dict[int, str]) -> AnalysisBatch:
+        # tasks dispatched through the outbox are published later, but their group can be
+        # recorded in the result backend up front so /group_status works the same way
+        group_result = GroupResult(uuid(), [AsyncResult(task_id, app=celery_app) for task_id in task_ids.values()],
+                                   app=celery_app)
+        try:
+            group_result.save()
+        except NotImplementedError:
+            return AnalysisBatch(group_id=None, task_ids=task_ids)
+        except Exception as e:
+            logger.warning("Could not save group %s: %s", group_result.id, e)
+            return AnalysisBatch(group_id=None, task_ids=task_ids)
+        return AnalysisBatch(group_id=group_result.id, task_ids=task_ids)
+
+    async def get_group_status(self, group_id: str) -> dict | None:
+        return await asyncio.to_thread(self._group_status, group_id)
+
+    @staticmethod
+    def _group_status(group_id: str) -> dict | None:
+        group_result = GroupResult.restore(group_id, app=celery_app)
+        if group_result is None:
+            return None
+
+        return {
+            "group_id": group_id,
+            "total": len(group_result.results),
+            "completed": group_result.completed_count(),
+            "failed": sum(1 for result in group_result.results if result.failed()),
+            "ready": group_result.ready()
+        }
+
     async def get_task_status(self, task_id: str) -> dict:
+        return await asyncio.to_thread(self._task_status, task_id)
+
+    @staticmethod
+    def _task_status(task_id: str) -> dict:
         task_result = AsyncResult(task_id, app=celery_app)
+        result = task_result.result
+        if isinstance(result, BaseException):
+            result = f"{type(result).__name__}: {result}"
         return {
             "task_id": task_id,
             "status": task_result.status,
-            "result": task_result.result
+            "result": result
         }
 
 
@@ -28,13 +120,11 @@ class RabbitMQHealthCheck:
     @staticmethod
     def check() -> HealthStatus:
         try:
-            connection = BlockingConnection(
-                ConnectionParameters(
-                    host='rabbitmq',
-                    port=5672,
-                    virtual_host='/',
-                    credentials=pika.PlainCredentials('user', 'password'))
-            )
+            parameters = pika.URLParameters(settings.celery_broker_url)
+            parameters.connection_attempts = 1
+            parameters.socket_timeout = settings.health_probe_timeout
+            parameters.blocked_connection_timeout = settings.health_probe_timeout
+            connection = BlockingConnection(parameters)
             connection.close()
         except Exception as e:
             return HealthStatus(
@@ -54,7 +144,7 @@ class TesseractHealthCheck:
     @staticmethod
     def check() -> HealthStatus:
         try:
-            pytesseract.get_tesseract_version()
+            version = pytesseract.get_tesseract_version()
         except Exception as e:
             return HealthStatus(
                 service="OCR Engine",
@@ -65,5 +155,5 @@ class TesseractHealthCheck:
             return HealthStatus(
                 service="OCR Engine",
                 status="OK",
-                details=f"Tesseract {pytesseract.get_tesseract_version()} is available"
-            )
\ No newline at end of file
+                details=f"Tesseract {version} is available"
+            )
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Iterator
+
+from app.application.interfaces import IDocumentStorage
+from app.core.config import settings
+
+DEFAULT_STORAGE_ROOT = Path(__file__).resolve().parent.parent / "documents"
+MAX_SUFFIX_LENGTH = 16
+SHARD_NAME_LENGTH = 2
+
+
+class LocalDocumentStorage(IDocumentStorage):
+    def __init__(self, root: Path, fsync: bool = True):
+        self.root = root
+        self.fsync = fsync
+
+    def new_key(self, file_name: str) -> str:
+        # random keys spread files evenly over 256 * 256 directories and never collide;
+        # only the extension of the client's file name is kept
+        token = uuid.uuid4().hex
+        suffix = Path(file_name).suffix.lower()
+        if len(suffix) > MAX_SUFFIX_LENGTH or not suffix[1:].isalnum():
+            suffix = ""
+        return f"{token[:2]}/{token[2:4]}/{token}{suffix}"
+
+    def path(self, key: str) -> Path:
+        # keys stored before sharding are absolute paths and resolve to themselves
+        return self.root / key
+
+    async def save(self, key: str, chunks: AsyncIterator[bytes]) -> None:
+        path = self.path(key)
+        part_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+
+        buffer = await asyncio.to_thread(open, part_path, "xb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(buffer.write, chunk)
+            await asyncio.to_thread(self._commit, buffer, part_path, path)
+        except BaseException:
+            await asyncio.to_thread(buffer.close)
+            await asyncio.to_thread(_remove_file, part_path)
+            raise
+
+    def _commit(self, buffer: BinaryIO, part_path: Path, path: Path) -> None:
+        # the file only appears under its key once it is complete
+        buffer.flush()
+        if self.fsync:
+            os.fsync(buffer.fileno())
+        buffer.close()
+        os.replace(part_path, path)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self.remove, key)
+
+    def remove(self, key: str) -> bool:
+        return _remove_file(self.path(key))
+
+    def iter_keys(self) -> Iterator[tuple[str, float]]:
+        # only the sharded layout is listed; files stored before sharding sit directly in the
+        # root under absolute-path keys and are left alone
+        for first in _scan_shards(self.root):
+            for second in _scan_shards(first.path):
+                with os.scandir(second.path) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            yield f"{first.name}/{second.name}/{entry.name}", entry.stat().st_mtime
+
+    @contextmanager
+    def local_path(self, key: str) -> Iterator[str]:
+        path = self.path(key)
+        if not path.exists():
+            raise FileNotFoundError(f"File not found at {path}")
+        yield str(path)
+
+
+def _remove_file(path: Path) -> bool:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _scan_shards(path) -> list[os.DirEntry]:
+    try:
+        with os.scandir(path) as entries:
+            return [
+                entry for entry in entries
+                if len(entry.name) == SHARD_NAME_LENGTH and entry.is_dir(follow_symlinks=False)
+            ]
+    except FileNotFoundError:
+        return []
+
+
+def create_document_storage() -> IDocumentStorage:
+    if settings.storage_backend == "local":
+        root = Path(settings.storage_root) if settings.storage_root else DEFAULT_STORAGE_ROOT
+        return LocalDocumentStorage(root, fsync=settings.storage_fsync)
+    raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+
+
+document_storage = create_document_storage()
@@ -1,48 +1,392 @@
-import pytesseract
+from celery import chord
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_ready, worker_shutdown
+from celery.utils.log import get_task_logger
+from datetime import datetime, timezone
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
+from dataclasses import asdict
+from typing import Iterator, Optional
 import os
+import time
 
 from app.infrastructure.celery import celery_app
 from app.infrastructure.database import SyncSession
 from app.infrastructure.models import DocumentTextModel, DocumentModel
+from app.infrastructure.notifications import document_text_notification, document_text_notifications
+from app.infrastructure.repositories import document_text_upsert, document_texts_upsert, \
+    document_analysis_failed, DOCUMENT_ANALYSIS_COMPLETED
+from app.infrastructure.write_behind import WriteBehindBuffer
+from app.infrastructure.metrics import DB_WRITE_DURATION, OCR_STAGE_DURATION, MULTIPROC_DIR, observe_stage_timings, \
+    queue_wait_seconds, start_worker_exporter, mark_process_dead
+from app.infrastructure.layout import encode_layout
+from app.infrastructure.ocr import get_ocr_engine, shutdown_ocr_engine
+from app.infrastructure.retention import RetentionRun
+from app.infrastructure.preprocessing import PageGeometry, PreprocessingOptions, preprocess_image
+from app.infrastructure.storage import document_storage
 from app.core.config import settings
 
-pytesseract.pytesseract.tesseract_cmd = settings.tesseract_path
+logger = get_task_logger(__name__)
+
+PDF_SIGNATURE = b"%PDF-"
+PDF_PAGE_SEPARATOR = "\f"
+
+
+def store_document_texts(rows: list[dict]) -> None:
+    # one multi-row upsert per flush; a document can appear only once per statement
+    rows = list({row["document_id"]: row for row in rows}.values())
+    with SyncSession() as session:
+        session.execute(document_texts_upsert([
+            {key: row[key] for key in ("document_id", "extracted_text", "diagnostics", "layout")}
+            for row in rows
+        ]))
+        session.execute(DOCUMENT_ANALYSIS_COMPLETED, [
+            {"completed_document_id": row["document_id"], "completed_task_id": row["task_id"]}
+            for row in rows
+        ])
+        session.execute(document_text_notifications([row["document_id"] for row in rows]))
+        session.commit()
+
+
+text_write_buffer = WriteBehindBuffer(
+    store_document_texts,
+    max_batch=settings.ocr_write_behind_max_batch,
+    max_delay=settings.ocr_write_behind_max_delay
+)
+
+
+@worker_init.connect
+def start_metrics_exporter(sender=None, **kwargs):
+    if settings.worker_metrics_port is None:
+        return
+    if not MULTIPROC_DIR and "prefork" in str(sender.pool_cls):
+        logger.warning("PROMETHEUS_MULTIPROC_DIR is not set; task metrics of pool processes will not be exported")
+    start_worker_exporter(settings.worker_metrics_port)
+
+
+@worker_init.connect
+def check_write_behind_pool(sender=None, **kwargs):
+    # the buffer batches results only within one process: a pool process runs one task at a time,
+    # so under any other pool every task would just wait out max_delay for a batch of one
+    if settings.ocr_write_behind_enabled and "concurrency.thread." not in str(sender.pool_cls):
+        settings.ocr_write_behind_enabled = False
+        sender.write_behind_disabled = True
+
+
+@worker_ready.connect
+def log_write_behind_disabled(sender=None, **kwargs):
+    # logging is configured only after worker_init
+    if getattr(sender.controller, "write_behind_disabled", False):
+        logger.warning("OCR write-behind is disabled: it needs the thread pool (-P threads)")
+
+
+@worker_process_init.connect
+def init_ocr_engine(**kwargs):
+    get_ocr_engine()
+
+
+@worker_process_shutdown.connect
+def close_ocr_engine(**kwargs):
+    text_write_buffer.close()
+    shutdown_ocr_engine()
+    mark_process_dead(os.getpid())
+
+
+@worker_shutdown.connect
+def flush_text_write_buffer(**kwargs):
+    text_write_buffer.close()
 
 
 @celery_app.task(bind=True, name="process_document")
-def process_document_task(self, document_id: int):
+def process_document_task(self, document_id: int, preprocessing: Optional[dict] = None, force: bool = False):
+    started = time.perf_counter()
     with SyncSession() as session:
         document = session.query(DocumentModel).filter_by(id=document_id).first()
         if not document:
             raise ValueError(f"Document with id {document_id} not found")
 
-        if not os.path.exists(document.file_path):
-            raise FileNotFoundError(f"File not found at {document.file_path}")
+        options = PreprocessingOptions.from_settings(preprocessing)
+        diagnostics = task_diagnostics(self.request, document, options)
 
-        try:
-            text = extract_text_from_image(document.file_path)
-
-            doc_text = DocumentTextModel(
-                document_id=document.id,
-                extracted_text=text)
-        except Exception as e:
-            session.rollback()
-            raise
-
-        else:
-            session.add(doc_text)
-            session.commit()
+        cached = None
+        # stored texts do not record the preprocessing they were read with, so overrides always run OCR
+        if not force and not preprocessing:
+            cached = find_text_by_file_hash(session, document.file_hash, exclude_document_id=document.id)
+        if cached is not None:
+            cached_text, cached_layout = cached
+            diagnostics["cached"] = True
+            diagnostics["timings"]["task"] = time.perf_counter() - started
+            save_document_text(session, document.id, cached_text, diagnostics, self.request.id, cached_layout)
 
             return {
                 "status": "success",
                 "document_id": document_id,
-                "text_length": len(text)
+                "text_length": len(cached_text),
+                "cached": True
             }
 
-def extract_text_from_image(file_path: str) -> str:
+        with document_storage.local_path(document.file_path) as file_path:
+            if is_pdf(file_path):
+                page_count = get_pdf_page_count(file_path)
+                diagnostics["page_count"] = page_count
+                diagnostics["timings"]["task"] = time.perf_counter() - started
+                queue = (self.request.delivery_info or {}).get("routing_key")
+                return self.replace(
+                    build_pdf_workflow(document.id, document.file_path, page_count, preprocessing, queue, diagnostics)
+                )
+
+            try:
+                text, timings, image_info, layout = recognize_file(file_path, options)
+                logger.info("Document %s OCR timings: %s", document_id, format_timings(timings))
+            except Exception as e:
+                session.rollback()
+                raise
+
+            else:
+                diagnostics["timings"].update(timings)
+                diagnostics["timings"]["task"] = time.perf_counter() - started
+                diagnostics["image"] = image_info
+                save_document_text(session, document.id, text, diagnostics, self.request.id,
+                                   encode_layout([layout]) if layout is not None else None)
+
+                return {
+                    "status": "success",
+                    "document_id": document_id,
+                    "text_length": len(text),
+                    "timings": timings
+                }
+
+
+@celery_app.task(bind=True, name="ocr_pdf_pages")
+def ocr_pdf_pages_task(self, file_key: str, first_page: int, last_page: int,
+                       preprocessing: Optional[dict] = None) -> list[dict]:
+    options = PreprocessingOptions.from_settings(preprocessing)
+    queue_wait = queue_wait_seconds(self.request)
+    with document_storage.local_path(file_key) as file_path:
+        return [
+            {"page": page_number, "text": text, "timings": timings, "image": image_info, "queue_wait": queue_wait,
+             "layout": layout}
+            for page_number, (text, timings, image_info, layout)
+            in enumerate(extract_text_from_pdf(file_path, first_page, last_page, options), first_page)
+        ]
+
+
+@celery_app.task(bind=True, name="save_pdf_text")
+def save_pdf_text_task(self, page_chunks: list[list[dict]], document_id: int, diagnostics: Optional[dict] = None):
+    pages = [page for chunk in page_chunks for page in chunk]
+    text = PDF_PAGE_SEPARATOR.join(page["text"] for page in pages)
+    timings = merge_timings(page["timings"] for page in pages)
+    layouts = [page.get("layout") for page in pages]
+    layout = encode_layout(layouts) if layouts and None not in layouts else None
+    logger.info("Document %s OCR timings over %s pages: %s", document_id, len(pages), format_timings(timings))
+
+    if diagnostics is not None:
+        page_waits = [page["queue_wait"] for page in pages if page.get("queue_wait") is not None]
+        diagnostics["timings"].update(timings)
+        diagnostics["timings"]["pages_queue_wait_max"] = max(page_waits) if page_waits else None
+        diagnostics["timings"]["save_queue_wait"] = queue_wait_seconds(self.request)
+        diagnostics["pages"] = [
+            {"page": page["page"], "timings": page["timings"], "image": page["image"], "queue_wait": page["queue_wait"]}
+            for page in pages
+        ]
+
+    # the chord body carries the id of the replaced process_document task, which holds the claim
+    with SyncSession() as session:
+        save_document_text(session, document_id, text, diagnostics, self.request.id, layout)
+
+    return {
+        "status": "success",
+        "document_id": document_id,
+        "text_length": len(text),
+        "pages": len(pages),
+        "timings": timings
+    }
+
+
+@celery_app.task(bind=True, name="apply_retention")
+def apply_retention_task(self):
+    def report_progress(report: dict) -> None:
+        logger.info("Retention progress: %s", report)
+        self.update_state(state="PROGRESS", meta=report)
+
+    return RetentionRun(document_storage, report_progress).run()
+
+
+@celery_app.task(name="mark_analysis_failed")
+def mark_analysis_failed_task(document_id: int, task_id: str):
+    with SyncSession() as session:
+        session.execute(document_analysis_failed(document_id, task_id))
+        session.commit()
+
+
+def task_diagnostics(request, document: DocumentModel, options: PreprocessingOptions) -> dict:
+    return {
+        "task_id": request.id,
+        "worker": request.hostname,
+        "queue": (request.delivery_info or {}).get("routing_key"),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "file_size": document.file_size,
+        "content_type": document.content_type,
+        "page_count": document.page_count,
+        "engine": {
+            "name": get_ocr_engine().name,
+            "language": settings.ocr_language,
+            "pdf_dpi": settings.pdf_dpi,
+            "pdf_pages_per_task": settings.pdf_pages_per_task,
+            "layout": settings.ocr_layout_enabled
+        },
+        "preprocessing": asdict(options),
+        "cached": False,
+        "timings": {"queue_wait": queue_wait_seconds(request)}
+    }
+
+
+def save_document_text(session, document_id: int, text: str, diagnostics: Optional[dict] = None,
+                       task_id: Optional[str] = None, layout: Optional[bytes] = None) -> None:
+    # the write's own duration goes to the histogram only; storing it in the row would take a second write
+    with DB_WRITE_DURATION.time():
+        if settings.ocr_write_behind_enabled:
+            # end the read transaction so the connection is not held while waiting for the flush;
+            # blocking until the batch commits keeps the late ack behind the durable write
+            session.commit()
+            text_write_buffer.submit(
+                {"document_id": document_id, "extracted_text": text, "diagnostics": diagnostics, "task_id": task_id,
+                 "layout": layout}
+            ).result()
+            return
+
+        session.execute(document_text_upsert(document_id, text, diagnostics, layout))
+        session.execute(DOCUMENT_ANALYSIS_COMPLETED, [{"completed_document_id": document_id, "completed_task_id": task_id}])
+        session.execute(document_text_notification(document_id))
+        session.commit()
+
+
+def build_pdf_workflow(document_id: int, file_key: str, page_count: int, preprocessing: Optional[dict] = None,
+                       queue: Optional[str] = None, diagnostics: Optional[dict] = None):
+    # page subtasks stay on the queue the document was routed to
+    options = {"queue": queue} if queue else {}
+    step = max(settings.pdf_pages_per_task, 1)
+    header = [
+        ocr_pdf_pages_task.s(file_key, first_page, min(first_page + step - 1, page_count), preprocessing).set(**options)
+        for first_page in range(1, page_count + 1, step)
+    ]
+    return chord(header, save_pdf_text_task.s(document_id, diagnostics).set(**options))
+
+
+def is_pdf(file_path: str) -> bool:
+    with open(file_path, "rb") as f:
+        return f.read(len(PDF_SIGNATURE)) == PDF_SIGNATURE
+
+
+def get_pdf_page_count(file_path: str) -> int:
     try:
-        img = Image.open(file_path)
-        return pytesseract.image_to_string(img)
+        return int(pdfinfo_from_path(file_path)["Pages"])
     except Exception as e:
-        raise RuntimeError(f"OCR processing failed: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Failed to read PDF page count: {str(e)}")
+
+
+def find_text_by_file_hash(session, file_hash: str | None,
+                           exclude_document_id: int | None = None) -> tuple[str, bytes | None] | None:
+    if not file_hash:
+        return None
+
+    query = session.query(DocumentTextModel.extracted_text, DocumentTextModel.layout) \
+        .join(DocumentModel, DocumentModel.id == DocumentTextModel.document_id) \
+        .filter(DocumentModel.file_hash == file_hash, DocumentModel.id != exclude_document_id)
+    if settings.ocr_layout_enabled:
+        query = query.filter(DocumentTextModel.layout.is_not(None))
+    row = query.limit(1).first()
+    return tuple(row) if row else None
+
+
+def image_details(image: Image.Image) -> dict:
+    dpi = image.info.get("dpi")
+    return {
+        "width": image.width,
+        "height": image.height,
+        "mode": image.mode,
+        "dpi": [float(value) for value in dpi] if dpi else None
+    }
+
+
+def recognize_image(image: Image.Image, options: PreprocessingOptions,
+                    page: int = 1) -> tuple[str, dict[str, float], dict, Optional[dict]]:
+    started = time.perf_counter()
+    image.load()
+    decode_time = time.perf_counter() - started
+    source = image_details(image)
+
+    image, timings, geometry = preprocess_image(image, options)
+    timings = {"decode": decode_time, **timings}
+
+    started = time.perf_counter()
+    layout = None
+    if settings.ocr_layout_enabled:
+        text, layout = get_ocr_engine().image_to_layout(image, page)
+        layout = source_layout(layout, geometry)
+    else:
+        text = get_ocr_engine().image_to_string(image)
+    timings["ocr"] = time.perf_counter() - started
+    observe_stage_timings(timings)
+    return text, timings, {"source": source, "ocr": image_details(image)}, layout
+
+
+def source_layout(layout: dict, geometry: PageGeometry) -> dict:
+    # tesseract finds the boxes on the preprocessed image; they are stored in pixels of the source page
+    if geometry.steps:
+        boxes = geometry.to_source(layout["left"], layout["top"], layout["width"], layout["height"])
+        for name, column in zip(("left", "top", "width", "height"), boxes):
+            layout[name] = column.tolist()
+        layout["page_width"], layout["page_height"] = geometry.source_size
+    return layout
+
+
+def recognize_file(file_path: str, options: PreprocessingOptions) -> tuple[str, dict[str, float], dict, Optional[dict]]:
+    try:
+        started = time.perf_counter()
+        with Image.open(file_path) as img:
+            open_time = time.perf_counter() - started
+            text, timings, image_info, layout = recognize_image(img, options)
+            return text, {"open": open_time, **timings}, image_info, layout
+    except Exception as e:
+        raise RuntimeError(f"OCR processing failed: {str(e)}")
+
+
+def extract_text_from_image(file_path: str, options: Optional[PreprocessingOptions] = None) -> str:
+    text, _, _, _ = recognize_file(file_path, options or PreprocessingOptions.from_settings())
+    return text
+
+
+def extract_text_from_pdf(file_path: str, first_page: int, last_page: int,
+                          options: PreprocessingOptions) -> Iterator[tuple[str, dict[str, float], dict, Optional[dict]]]:
+    for page_number in range(first_page, last_page + 1):
+        try:
+            started = time.perf_counter()
+            images = convert_from_path(
+                file_path,
+                dpi=settings.pdf_dpi,
+                first_page=page_number,
+                last_page=page_number
+            )
+            rasterize_time = time.perf_counter() - started
+            OCR_STAGE_DURATION.labels(stage="rasterize").observe(rasterize_time)
+            try:
+                text, timings, image_info, layout = recognize_image(images[0], options, page_number)
+            finally:
+                for image in images:
+                    image.close()
+        except Exception as e:
+            raise RuntimeError(f"OCR processing failed on page {page_number}: {str(e)}")
+
+        yield text.rstrip(PDF_PAGE_SEPARATOR), {"rasterize": rasterize_time, **timings}, image_info, layout
+
+
+def merge_timings(timings_list) -> dict[str, float]:
+    merged = {}
+    for timings in timings_list:
+        for step, seconds in timings.items():
+            merged[step] = merged.get(step, 0.0) + seconds
+    return merged
+
+
+def format_timings(timings: dict[str, float]) -> str:
+    return ", ".join(f"{step}={seconds * 1000:.1f}ms" for step, seconds in timings.items())
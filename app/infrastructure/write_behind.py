@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush: Callable[[list], None], max_batch: int, max_delay: float):
+        self._flush = flush
+        self.max_batch = max(max_batch, 1)
+        self.max_delay = max_delay
+        self._pending: list[tuple[Any, Future, float]] = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, item) -> Future:
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Write-behind buffer is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+            self._pending.append((item, future, time.monotonic()))
+            self._condition.notify()
+        return future
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _next_batch(self) -> list[tuple[Any, Future, float]] | None:
+        with self._condition:
+            while True:
+                if self._pending:
+                    if len(self._pending) >= self.max_batch or self._closed:
+                        break
+                    remaining = self._pending[0][2] + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self) -> None:
+        while (batch := self._next_batch()) is not None:
+            self._flush_batch(batch)
+
+    def _flush_batch(self, batch: list[tuple[Any, Future, float]]) -> None:
+        started = time.perf_counter()
+        try:
+            self._flush([item for item, _, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                logger.exception("Write-behind flush failed")
+                batch[0][1].set_exception(e)
+                return
+            # one bad item must not fail the others: the halves are flushed separately until
+            # only the failing items are left
+            logger.warning("Write-behind flush of %s items failed, retrying in halves: %s", len(batch), e)
+            middle = len(batch) // 2
+            self._flush_batch(batch[:middle])
+            self._flush_batch(batch[middle:])
+        else:
+            logger.debug("Flushed %s items in %.1fms", len(batch), (time.perf_counter() - started) * 1000)
+            for _, future, _ in batch:
+                future.set_result(None)
@@ -1,9 +1,17 @@
 from fastapi import FastAPI
-from starlette.responses import JSONResponse
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
+import logging
+import time
 
 from app.core.config import settings
+from app.infrastructure.admission import admission_controller
+from app.infrastructure.cache import document_text_cache
+from app.infrastructure.metrics import HTTP_REQUEST_DURATION, metrics_payload
+from app.infrastructure.notifications import document_text_listener
+from app.infrastructure.outbox import outbox_relay
 from app.presentation.api import router
 
 app = FastAPI(
@@ -15,6 +23,106 @@ app = FastAPI(
 
 app.include_router(router)
 
+logger = logging.getLogger(__name__)
+
+
+@app.on_event("startup")
+async def start_notification_listener():
+    # cached texts are invalidated by the notifications sent when a text is stored or deleted
+    document_text_listener.add_observer(document_text_cache.invalidate, document_text_cache.clear)
+    try:
+        await document_text_listener.start()
+    except Exception as e:
+        logger.warning("Notification listener unavailable, cached texts expire after %ss: %s",
+                       settings.text_cache_ttl, e)
+        document_text_listener.schedule_reconnect()
+
+
+@app.on_event("startup")
+async def start_outbox_relay():
+    if settings.task_dispatch_mode == "outbox":
+        await outbox_relay.start()
+
+
+@app.on_event("startup")
+async def start_admission_controller():
+    if settings.admission_enabled:
+        await admission_controller.start()
+
+
+@app.on_event("shutdown")
+async def close_notification_listener():
+    await document_text_listener.stop()
+
+
+@app.on_event("shutdown")
+async def stop_outbox_relay():
+    await outbox_relay.stop()
+
+
+@app.on_event("shutdown")
+async def stop_admission_controller():
+    await admission_controller.stop()
+
+
+class RequestSizeLimitMiddleware:
+    # Content-Length is checked up front; chunked or unannounced bodies are counted as they are
+    # received, so the multipart parser never buffers more than the limit
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_size = settings.bulk_max_request_size if scope["path"].endswith("/upload_doc_bulk") \
+            else settings.max_request_size
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > max_size:
+            response = JSONResponse(
+                status_code=413,
+                content={"detail": f"Request body exceeds {max_size} bytes"}
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_size:
+                    # raised inside body parsing, so FastAPI turns it into the 413 response
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {max_size} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(RequestSizeLimitMiddleware)
+
+
+@app.middleware("http")
+async def observe_request_duration(request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template so path parameters do not explode the series count
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.labels(
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=str(status)
+        ).observe(time.perf_counter() - started)
+
+
 @app.exception_handler(Exception)
 async def universal_exception_handler(request, exc):
     return JSONResponse(
@@ -23,6 +131,12 @@ async def universal_exception_handler(request, exc):
     )
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    payload, content_type = metrics_payload()
+    return Response(content=payload, media_type=content_type)
+
+
 @app.get("/", include_in_schema=False)
 async def root():
     return {
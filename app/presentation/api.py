@@ -1,21 +1,78 @@
-from typing import Union
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, status
+from datetime import datetime
+from typing import Optional, Union
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Header, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 import base64
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 
+from app.domain.exceptions import FileTooLargeError, UnsupportedFileTypeError
 from app.application.use_cases import HealthCheckUseCase, DocumentUploadUseCase, DocumentUploadSwaggerUseCase, \
-    DocumentDeleteUseCase, DocumentAnalyzeUseCase, GetDocumentTextUseCase
+    DocumentDeleteUseCase, DocumentAnalyzeUseCase, GetDocumentTextUseCase, DocumentBatchAnalyzeUseCase, \
+    WaitDocumentTextUseCase, SearchDocumentTextUseCase, ListDocumentsUseCase, GetDocumentDiagnosticsUseCase, \
+    GetDocumentLayoutUseCase, DocumentBulkUploadUseCase
 from app.infrastructure.repositories import PostgresHealthCheckRepository, PostgresDocumentRepository
+from app.infrastructure.admission import BATCH, INTERACTIVE, admission_controller
+from app.core.config import settings
 from app.infrastructure.database import get_db
+from app.infrastructure.notifications import document_text_listener
+from app.infrastructure.outbox import PostgresTaskOutbox
 from app.infrastructure.services import CeleryWorkerService
-from app.presentation.schemas import HealthCheckResponse, HealthStatusResponse, DocumentResponse, \
+from app.infrastructure.cache import document_text_cache
+from app.infrastructure.storage import document_storage
+from app.presentation.schemas import HealthCheckResponse, HealthStatusResponse, LivenessResponse, DocumentResponse, \
     DocumentUploadSwaggerResponse, DocumentDeleteResponse, DocumentAnalyzeResponse, DocumentTextResponse, \
-    DocumentTextNotFoundResponse
+    DocumentTextNotFoundResponse, DocumentTextPendingResponse, TaskStatusResponse, DocumentSearchResponse, DocumentListResponse, DocumentBatchAnalyzeRequest, DocumentBatchAnalyzeResponse, GroupStatusResponse, \
+    DocumentAnalyzeRequest, PreprocessingRequest, DocumentDiagnosticsResponse, DocumentLayoutResponse, \
+    DocumentBulkUploadResponse
 
 router = APIRouter(prefix="/api/v1", tags=["Health Check"])
 
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def task_outbox(db: AsyncSession) -> Optional[PostgresTaskOutbox]:
+    return PostgresTaskOutbox(db) if settings.task_dispatch_mode == "outbox" else None
+
+
+def client_key(http_request: Request) -> str:
+    # the header is whatever the caller sends, so the per-client limit is only as good as the clients
+    client = http_request.headers.get(settings.admission_client_header)
+    if client:
+        return client[:100]
+    return http_request.client.host if http_request.client else "unknown"
+
+
+def admit(client: str, traffic_class: str, count: int = 1, detail: str = "Analysis backlog is full, retry later") -> None:
+    retry_after = admission_controller.check(client, traffic_class, count)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+def admitted_client(traffic_class: str):
+    def dependency(client: str = Depends(client_key)) -> str:
+        admit(client, traffic_class)
+        return client
+    return dependency
+
+
+def preprocessing_overrides(preprocessing: Optional[PreprocessingRequest]) -> Optional[dict]:
+    if preprocessing is None:
+        return None
+    return preprocessing.model_dump(exclude_none=True) or None
+
+
 @router.get("/health", response_model=HealthCheckResponse)
 async def health_check(db: AsyncSession = Depends(get_db)):
     try:
@@ -54,13 +111,28 @@ async def health_check(db: AsyncSession = Depends(get_db)):
         }
 
 
+@router.get("/health/live", response_model=LivenessResponse, summary="Liveness probe", description="Reports that the API process is serving requests without probing dependencies")
+async def liveness_check():
+    return {"status": "OK"}
+
+
 @router.post("/upload_doc", response_model=DocumentResponse)
 async def upload_document(file_name: str = Form(...), file_content: str = Form(...), db: AsyncSession = Depends(get_db)):
     try:
         repo = PostgresDocumentRepository(db)
-        use_case = DocumentUploadUseCase(repo)
+        use_case = DocumentUploadUseCase(repo, document_storage)
         document = await use_case.execute(file_name, file_content)
 
+    except FileTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid file content: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -87,11 +159,16 @@ async def upload_document_swagger(file: UploadFile = File(..., description="Docu
             )
 
         repo = PostgresDocumentRepository(db)
-        use_case = DocumentUploadSwaggerUseCase(repo)
+        use_case = DocumentUploadSwaggerUseCase(repo, document_storage)
         document = await use_case.execute(file)
 
     except HTTPException:
         raise
+    except FileTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -108,10 +185,83 @@ async def upload_document_swagger(file: UploadFile = File(..., description="Docu
         await file.close()
 
 
+@router.post("/upload_doc_bulk", response_model=DocumentBulkUploadResponse, status_code=status.HTTP_201_CREATED,
+             summary="Upload documents in bulk",
+             description="Uploads many documents in one multipart request; ZIP archives are unpacked into separate "
+                         "documents. All files are stored or none are, and analysis can be started for all of them")
+async def upload_documents_bulk(files: list[UploadFile] = File(..., description="Documents or ZIP archives of documents"),
+                                analyze: bool = Form(False), db: AsyncSession = Depends(get_db),
+                                worker: CeleryWorkerService = Depends(), client: str = Depends(client_key)):
+    if analyze:
+        # checked before anything is stored, so a rejected request leaves no documents behind;
+        # archives are only counted once unpacked, every file is at least one document
+        admit(client, BATCH, len(files))
+
+    try:
+        repo = PostgresDocumentRepository(db)
+        use_case = DocumentBulkUploadUseCase(repo, document_storage)
+        uploaded = await use_case.execute(files)
+
+    except FileTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except UnsupportedFileTypeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error uploading documents: {str(e)}"
+        )
+    finally:
+        for file in files:
+            await file.close()
+
+    batch = None
+    if analyze:
+        document_ids = [document.id for _, document in uploaded]
+        admit(client, BATCH, len(document_ids),
+              f"Documents {', '.join(map(str, document_ids))} were uploaded, but the analysis backlog is full; "
+              f"start their analysis later")
+        try:
+            batch = await DocumentBatchAnalyzeUseCase(worker, repo, task_outbox(db)).execute(document_ids, client=client)
+            admission_controller.record(client, len(batch.task_ids))
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Documents {', '.join(map(str, document_ids))} were uploaded, "
+                       f"but starting analysis failed: {str(e)}"
+            )
+
+    return {
+        "message": f"{len(uploaded)} files uploaded successfully",
+        "documents": [
+            {
+                "file_name": file_name,
+                "document_id": document.id,
+                "file_path": document.file_path,
+                "content_type": document.content_type,
+                "upload_date": document.upload_date
+            }
+            for file_name, document in uploaded
+        ],
+        "analysis": batch_analysis_response(batch) if batch else None
+    }
+
+
 @router.delete("/doc_delete/{document_id}", response_model=DocumentDeleteResponse, summary="Delete document", description="Deletes document from database and filesystem")
 async def delete_document(document_id: int, db: AsyncSession = Depends(get_db)):
     repo = PostgresDocumentRepository(db)
-    use_case = DocumentDeleteUseCase(repo)
+    use_case = DocumentDeleteUseCase(repo, document_storage, document_text_cache)
     success = await use_case.execute(document_id)
 
     if not success:
@@ -127,12 +277,28 @@ async def delete_document(document_id: int, db: AsyncSession = Depends(get_db)):
     }
 
 
-@router.post("/doc_analyse/{document_id}", response_model=DocumentAnalyzeResponse, summary="Analyze document", description="Starts background text recognition for document")
-async def analyze_document(document_id: int, db: AsyncSession = Depends(get_db), worker: CeleryWorkerService = Depends()):
+ANALYSIS_MESSAGES = {
+    "started": "Document analysis started in background",
+    "in_progress": "Document analysis is already in progress",
+    "completed": "Document has already been analyzed",
+}
+
+
+@router.post("/doc_analyse/{document_id}", response_model=DocumentAnalyzeResponse, summary="Analyze document",
+             description="Starts background text recognition for document. Repeated requests return the in-flight "
+                         "or finished analysis unless force is set")
+async def analyze_document(document_id: int, request: Optional[DocumentAnalyzeRequest] = None,
+                           db: AsyncSession = Depends(get_db), worker: CeleryWorkerService = Depends(),
+                           client: str = Depends(admitted_client(INTERACTIVE))):
     try:
         repo = PostgresDocumentRepository(db)
-        use_case = DocumentAnalyzeUseCase(worker, repo)
-        task_id = await use_case.execute(document_id)
+        use_case = DocumentAnalyzeUseCase(worker, repo, task_outbox(db))
+        analysis = await use_case.execute(
+            document_id,
+            preprocessing_overrides(request and request.preprocessing),
+            force=bool(request and request.force),
+            client=client
+        )
 
     except ValueError as e:
         raise HTTPException(
@@ -146,20 +312,85 @@ async def analyze_document(document_id: int, db: AsyncSession = Depends(get_db),
         )
 
     else:
+        if analysis.status == "started":
+            admission_controller.record(client, 1)
         return {
-            "status": "started",
-            "task_id": task_id,
+            "status": analysis.status,
+            "task_id": analysis.task_id,
             "document_id": document_id,
-            "message": "Document analysis started in background"
+            "message": ANALYSIS_MESSAGES[analysis.status]
         }
 
 
+@router.post("/doc_analyse_batch", response_model=DocumentBatchAnalyzeResponse, summary="Analyze documents in batch", description="Starts background text recognition for many documents as one Celery group")
+async def analyze_documents_batch(request: DocumentBatchAnalyzeRequest, db: AsyncSession = Depends(get_db), worker: CeleryWorkerService = Depends(),
+                                  client: str = Depends(client_key)):
+    admit(client, BATCH, len(request.document_ids))
+    try:
+        repo = PostgresDocumentRepository(db)
+        use_case = DocumentBatchAnalyzeUseCase(worker, repo, task_outbox(db))
+        batch = await use_case.execute(request.document_ids, preprocessing_overrides(request.preprocessing), request.force,
+                                       client=client)
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error starting batch analysis: {str(e)}"
+        )
+
+    else:
+        admission_controller.record(client, len(batch.task_ids))
+        return batch_analysis_response(batch)
+
+
+def batch_analysis_response(batch) -> dict:
+    return {
+        "status": "started" if batch.task_ids else "coalesced",
+        "group_id": batch.group_id,
+        "tasks": [
+            {"document_id": document_id, "status": "started", "task_id": task_id}
+            for document_id, task_id in batch.task_ids.items()
+        ] + [
+            {"document_id": analysis.document_id, "status": analysis.status, "task_id": analysis.task_id}
+            for analysis in batch.coalesced
+        ],
+        "message": f"Analysis started for {len(batch.task_ids)} documents, "
+                   f"{len(batch.coalesced)} already in progress or analyzed"
+    }
+
+
+@router.get("/group_status/{group_id}", response_model=GroupStatusResponse, summary="Get batch status", description="Returns progress of a batch analysis group")
+async def get_group_status(group_id: str, worker: CeleryWorkerService = Depends()):
+    try:
+        group_status = await worker.get_group_status(group_id)
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving group status: {str(e)}"
+        )
+
+    if group_status is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Group {group_id} not found"
+        )
+
+    return group_status
+
+
 @router.get("/get_text/{document_id}", response_model=Union[DocumentTextResponse, DocumentTextNotFoundResponse], summary="Get extracted text", description="Returns OCR extracted text for specified document")
-async def get_document_text(document_id: int, db: AsyncSession = Depends(get_db)):
+async def get_document_text(document_id: int, db: AsyncSession = Depends(get_db),
+                            if_none_match: Optional[str] = Header(None)):
     try:
         repo = PostgresDocumentRepository(db)
-        use_case = GetDocumentTextUseCase(repo)
-        doc_text = await use_case.execute(document_id)
+        use_case = GetDocumentTextUseCase(repo, document_text_cache)
+        cached = await use_case.execute(document_id)
 
     except ValueError as e:
         return JSONResponse(
@@ -175,8 +406,202 @@ async def get_document_text(document_id: int, db: AsyncSession = Depends(get_db)
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving document text: {str(e)}"
         )
+    else:
+        # clients revalidate on every request, so a re-analysis is never served stale
+        headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, cached.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return JSONResponse(
+            content={
+                "document_id": cached.text.document_id,
+                "extracted_text": cached.text.extracted_text
+            },
+            headers=headers
+        )
+
+
+@router.get("/doc_diagnostics/{document_id}", response_model=DocumentDiagnosticsResponse, summary="Get OCR diagnostics",
+            description="Returns the stage timings, image details and engine settings recorded when the text was extracted. "
+                        "The database write is not among the timings, since the diagnostics are stored by it; "
+                        "see the ocr_db_write_duration_seconds metric")
+async def get_document_diagnostics(document_id: int, db: AsyncSession = Depends(get_db)):
+    try:
+        repo = PostgresDocumentRepository(db)
+        use_case = GetDocumentDiagnosticsUseCase(repo)
+        diagnostics = await use_case.execute(document_id)
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving document diagnostics: {str(e)}"
+        )
+    else:
+        return {
+            "document_id": diagnostics.document_id,
+            "diagnostics": diagnostics.diagnostics
+        }
+
+
+@router.get("/get_layout/{document_id}", response_model=DocumentLayoutResponse, summary="Get word layout",
+            description="Returns the words of a page that intersect the given rectangle, or lie fully inside it when "
+                        "contained is set. Coordinates are pixels of the page image the OCR engine read; the rectangle "
+                        "defaults to the whole page. Requires analysis with OCR_LAYOUT_ENABLED")
+async def get_document_layout(document_id: int, page: int = Query(1, ge=1), left: int = Query(0, ge=0),
+                              top: int = Query(0, ge=0), right: Optional[int] = Query(None, ge=0),
+                              bottom: Optional[int] = Query(None, ge=0), contained: bool = False,
+                              db: AsyncSession = Depends(get_db)):
+    if (right is not None and right < left) or (bottom is not None and bottom < top):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Rectangle right/bottom must not be less than left/top"
+        )
+
+    try:
+        repo = PostgresDocumentRepository(db)
+        use_case = GetDocumentLayoutUseCase(repo)
+        page_layout = await use_case.execute(document_id, page, left, top, right, bottom, contained)
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving document layout: {str(e)}"
+        )
+    else:
+        return page_layout
+
+
+@router.get("/task_status/{task_id}", response_model=TaskStatusResponse, summary="Get task status", description="Returns Celery state of a background analysis task")
+async def get_task_status(task_id: str, worker: CeleryWorkerService = Depends()):
+    try:
+        return await worker.get_task_status(task_id)
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving task status: {str(e)}"
+        )
+
+
+@router.get("/wait_text/{document_id}", response_model=Union[DocumentTextResponse, DocumentTextPendingResponse], summary="Wait for extracted text",
+            description="Long-polls until the OCR result for the document is committed or the timeout expires")
+async def wait_document_text(document_id: int,
+                             timeout: float = Query(settings.long_poll_default_timeout, gt=0, le=settings.long_poll_max_timeout),
+                             db: AsyncSession = Depends(get_db)):
+    try:
+        repo = PostgresDocumentRepository(db)
+        use_case = WaitDocumentTextUseCase(repo, document_text_listener)
+        doc_text = await use_case.execute(document_id, timeout)
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error waiting for document text: {str(e)}"
+        )
+
+    if doc_text is None:
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={
+                "document_id": document_id,
+                "status": "pending",
+                "message": "Text is not ready yet"
+            }
+        )
+
+    return {
+        "document_id": doc_text.document_id,
+        "extracted_text": doc_text.extracted_text
+    }
+
+
+@router.get("/search_text", response_model=DocumentSearchResponse, summary="Search extracted text", description="Full-text search over OCR results, ranked with highlighted snippets. When a query matches "
+                        "more documents than can be ranked, only the most recent matches are ranked and "
+                        "truncated is set")
+async def search_document_text(q: str = Query(..., min_length=1, max_length=500),
+                               limit: int = Query(20, ge=1, le=settings.search_max_page_size),
+                               offset: int = Query(0, ge=0, le=settings.search_max_offset),
+                               db: AsyncSession = Depends(get_db)):
+    try:
+        repo = PostgresDocumentRepository(db)
+        use_case = SearchDocumentTextUseCase(repo)
+        hits, has_more, truncated = await use_case.execute(q, limit, offset)
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching document text: {str(e)}"
+        )
+
+    else:
+        return {
+            "query": q,
+            "limit": limit,
+            "offset": offset,
+            "has_more": has_more,
+            "truncated": truncated,
+            "results": [
+                {
+                    "document_id": hit.document_id,
+                    "rank": hit.rank,
+                    "snippet": hit.snippet
+                }
+                for hit in hits
+            ]
+        }
+
+
+@router.get("/doc_list", response_model=DocumentListResponse, summary="List documents", description="Lists documents oldest first with keyset pagination and OCR status")
+async def list_documents(limit: int = Query(100, ge=1, le=settings.list_max_page_size),
+                         cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+                         analyzed: Optional[bool] = Query(None, description="Only analyzed (true) or not yet analyzed (false) documents"),
+                         uploaded_since: Optional[datetime] = Query(None),
+                         db: AsyncSession = Depends(get_db)):
+    try:
+        repo = PostgresDocumentRepository(db)
+        use_case = ListDocumentsUseCase(repo)
+        items, next_cursor = await use_case.execute(limit, cursor, analyzed, uploaded_since)
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error listing documents: {str(e)}"
+        )
+
     else:
         return {
-            "document_id": doc_text.document_id,
-            "extracted_text": doc_text.extracted_text
-        }
\ No newline at end of file
+            "items": [
+                {
+                    "id": item.id,
+                    "file_path": item.file_path,
+                    "upload_date": item.upload_date,
+                    "ocr_status": "analyzed" if item.analyzed else "not_analyzed"
+                }
+                for item in items
+            ],
+            "next_cursor": next_cursor
+        }
@@ -1,6 +1,8 @@
 from datetime import datetime
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Any, Optional
+
+from app.core.config import settings
 
 class HealthStatusResponse(BaseModel):
     service: str
@@ -11,6 +13,9 @@ class HealthCheckResponse(BaseModel):
     status: str
     services: list[HealthStatusResponse]
 
+class LivenessResponse(BaseModel):
+    status: str
+
 class DocumentUploadRequest(BaseModel):
     file_name: str
     file_content: str
@@ -31,6 +36,13 @@ class DocumentUploadSwaggerResponse(BaseModel):
     file_path: str
     upload_date: datetime
 
+class DocumentBulkUploadItemResponse(BaseModel):
+    file_name: str
+    document_id: int
+    file_path: str
+    content_type: Optional[str] = None
+    upload_date: datetime
+
 class DocumentDeleteResponse(BaseModel):
     success: bool
     message: str
@@ -38,15 +50,111 @@ class DocumentDeleteResponse(BaseModel):
 
 class DocumentAnalyzeResponse(BaseModel):
     status: str
-    task_id: str
+    task_id: Optional[str] = None
     document_id: int
     message: str
 
+class PreprocessingRequest(BaseModel):
+    enabled: Optional[bool] = None
+    target_dpi: Optional[int] = Field(None, gt=0)
+    max_side: Optional[int] = Field(None, gt=0)
+    grayscale: Optional[bool] = None
+    binarize: Optional[bool] = None
+    binarize_window: Optional[int] = Field(None, ge=3)
+    deskew: Optional[bool] = None
+    max_skew_angle: Optional[float] = Field(None, gt=0, le=45)
+    crop_borders: Optional[bool] = None
+
+class DocumentAnalyzeRequest(BaseModel):
+    preprocessing: Optional[PreprocessingRequest] = None
+    force: bool = False
+
+class DocumentBatchAnalyzeRequest(BaseModel):
+    document_ids: list[int] = Field(..., min_length=1, max_length=settings.batch_analyze_max_size)
+    preprocessing: Optional[PreprocessingRequest] = None
+    force: bool = False
+
+class DocumentBatchTaskResponse(BaseModel):
+    document_id: int
+    status: str = "started"
+    task_id: Optional[str] = None
+
+class DocumentBatchAnalyzeResponse(BaseModel):
+    status: str
+    group_id: Optional[str] = None
+    tasks: list[DocumentBatchTaskResponse]
+    message: str
+
+class DocumentBulkUploadResponse(BaseModel):
+    message: str
+    documents: list[DocumentBulkUploadItemResponse]
+    analysis: Optional[DocumentBatchAnalyzeResponse] = None
+
+class GroupStatusResponse(BaseModel):
+    group_id: str
+    total: int
+    completed: int
+    failed: int
+    ready: bool
+
+class DocumentListItemResponse(BaseModel):
+    id: int
+    file_path: str
+    upload_date: datetime
+    ocr_status: str
+
+class DocumentListResponse(BaseModel):
+    items: list[DocumentListItemResponse]
+    next_cursor: Optional[str] = None
+
+class DocumentSearchHitResponse(BaseModel):
+    document_id: int
+    rank: float
+    snippet: str
+
+class DocumentSearchResponse(BaseModel):
+    query: str
+    limit: int
+    offset: int
+    has_more: bool
+    truncated: bool
+    results: list[DocumentSearchHitResponse]
+
+class TaskStatusResponse(BaseModel):
+    task_id: str
+    status: str
+    result: Optional[Any] = None
+
 class DocumentTextResponse(BaseModel):
     document_id: int
     extracted_text: str
     status: str = "success"
 
+class DocumentDiagnosticsResponse(BaseModel):
+    document_id: int
+    diagnostics: Optional[dict[str, Any]] = None
+
+class LayoutWordResponse(BaseModel):
+    text: str
+    left: int
+    top: int
+    width: int
+    height: int
+    line: int
+    confidence: float
+
+class DocumentLayoutResponse(BaseModel):
+    document_id: int
+    page: int
+    width: int
+    height: int
+    words: list[LayoutWordResponse]
+
+class DocumentTextPendingResponse(BaseModel):
+    document_id: int
+    status: str = "pending"
+    message: str = "Text is not ready yet"
+
 class DocumentTextNotFoundResponse(BaseModel):
     document_id: int
     status: str = "error"
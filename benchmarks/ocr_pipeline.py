@@ -0,0 +1,301 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from difflib import SequenceMatcher
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from sqlalchemy import create_engine, event
+
+from app.core.config import settings
+from app.infrastructure.celery import celery_app
+from app.infrastructure.database import Base, SyncSession
+from app.infrastructure.models import DocumentModel, DocumentTextModel
+from app.infrastructure.tasks import extract_text_from_image, process_document_task
+
+WORDS = (
+    "invoice total amount date customer order number account payment due balance "
+    "address street city country phone email tax subtotal quantity price item "
+    "description reference contract signature company delivery shipping bank"
+).split()
+MARGIN_INCHES = 0.5
+
+
+@dataclass
+class BenchmarkCase:
+    name: str
+    kind: str
+    width_inches: float
+    height_inches: float
+    dpi: int
+    font_points: int
+    noise: float = 0.0
+    skew: float = 0.0
+    pages: int = 1
+
+
+CASES = [
+    BenchmarkCase("receipt_200dpi", "image", 3.0, 6.0, 200, 10),
+    BenchmarkCase("letter_150dpi", "image", 8.5, 11.0, 150, 11),
+    BenchmarkCase("letter_300dpi", "image", 8.5, 11.0, 300, 11),
+    BenchmarkCase("letter_600dpi", "image", 8.5, 11.0, 600, 11),
+    BenchmarkCase("letter_300dpi_noisy", "image", 8.5, 11.0, 300, 11, noise=25.0),
+    BenchmarkCase("letter_300dpi_skewed", "image", 8.5, 11.0, 300, 11, skew=2.0),
+    BenchmarkCase("pdf_1_page", "pdf", 8.5, 11.0, 300, 11),
+    BenchmarkCase("pdf_5_pages", "pdf", 8.5, 11.0, 300, 11, pages=5),
+    BenchmarkCase("pdf_20_pages", "pdf", 8.5, 11.0, 150, 11, pages=20),
+]
+
+
+def render_page(case: BenchmarkCase, rng: random.Random) -> tuple[Image.Image, str]:
+    width, height = round(case.width_inches * case.dpi), round(case.height_inches * case.dpi)
+    margin = round(MARGIN_INCHES * case.dpi)
+    font = ImageFont.load_default(size=max(round(case.font_points * case.dpi / 72), 8))
+    line_height = round(font.size * 1.5)
+
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    lines = []
+    for top in range(margin, height - margin - line_height, line_height):
+        words = []
+        while True:
+            candidate = words + [rng.choice(WORDS) if rng.random() > 0.2 else str(rng.randint(1, 99999))]
+            if draw.textlength(" ".join(candidate), font=font) > width - 2 * margin:
+                break
+            words = candidate
+        line = " ".join(words)
+        draw.text((margin, top), line, fill=0, font=font)
+        lines.append(line)
+
+    if case.noise:
+        pixels = np.asarray(image, dtype=np.float64)
+        pixels += np.random.default_rng(rng.randint(0, 2 ** 32)).normal(0.0, case.noise, pixels.shape)
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), mode="L")
+    if case.skew:
+        image = image.rotate(case.skew, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+
+    return image, "\n".join(lines)
+
+
+def render_case(case: BenchmarkCase, directory: Path, seed: int) -> tuple[Path, str]:
+    rng = random.Random(f"{seed}:{case.name}")
+    pages = [render_page(case, rng) for _ in range(case.pages)]
+    images = [image for image, _ in pages]
+
+    if case.kind == "pdf":
+        path = directory / f"{case.name}.pdf"
+        images[0].save(path, save_all=True, append_images=images[1:], resolution=case.dpi)
+    else:
+        path = directory / f"{case.name}.png"
+        images[0].save(path, dpi=(case.dpi, case.dpi))
+
+    return path, "\f".join(text for _, text in pages)
+
+
+def use_database_stand_in(database_path: Path) -> None:
+    engine = create_engine(f"sqlite:///{database_path}")
+
+    @event.listens_for(engine, "connect")
+    def register_pg_notify(connection, record):
+        connection.create_function("pg_notify", 2, lambda channel, payload: None)
+
+    Base.metadata.create_all(engine)
+    SyncSession.configure(bind=engine)
+
+
+def add_document(file_path: Path) -> int:
+    with SyncSession() as session:
+        document = DocumentModel(file_path=str(file_path), file_size=file_path.stat().st_size)
+        session.add(document)
+        session.commit()
+        return document.id
+
+
+def load_text(document_id: int) -> str:
+    with SyncSession() as session:
+        return session.query(DocumentTextModel.extracted_text).filter_by(document_id=document_id).scalar()
+
+
+def normalize_words(text: str) -> list[str]:
+    return text.lower().split()
+
+
+def word_error_rate(expected: str, actual: str) -> float:
+    reference, hypothesis = normalize_words(expected), normalize_words(actual)
+    if not reference:
+        return float(bool(hypothesis))
+
+    previous = list(range(len(hypothesis) + 1))
+    for i, word in enumerate(reference, 1):
+        current = [i]
+        for j, candidate in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (word != candidate)))
+        previous = current
+    return previous[-1] / len(reference)
+
+
+def character_accuracy(expected: str, actual: str) -> float:
+    return SequenceMatcher(None, " ".join(normalize_words(expected)), " ".join(normalize_words(actual)),
+                           autojunk=False).ratio()
+
+
+def summarize(latencies: list[float], pages: int) -> dict:
+    total = sum(latencies)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "iterations": len(latencies),
+        "total_seconds": total,
+        "documents_per_second": len(latencies) / total if total else None,
+        "pages_per_second": len(latencies) * pages / total if total else None,
+        "latency_seconds": {
+            "min": min(latencies),
+            "mean": total / len(latencies),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": max(latencies),
+        },
+    }
+
+
+def peak_rss() -> dict:
+    # ru_maxrss is reported in kilobytes on Linux; pytesseract runs tesseract as a child process
+    return {
+        "process_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "children_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+    }
+
+
+def run_case(case: BenchmarkCase, work_dir: str, seed: int, iterations: int, warmup: int) -> dict:
+    directory = Path(work_dir)
+    use_database_stand_in(directory / f"{case.name}.sqlite3")
+    # eager mode runs the PDF chord inline; its results are kept in memory instead of the broker
+    celery_app.conf.update(task_always_eager=True, result_backend="cache+memory://")
+
+    file_path, expected = render_case(case, directory, seed)
+    result = {
+        "case": asdict(case),
+        "file_size": file_path.stat().st_size,
+        "modes": {},
+    }
+
+    runners = {"process_document_task": lambda: process_document_task.apply(args=[document_id]).get()}
+    if case.kind == "image":
+        runners["extract_text_from_image"] = lambda: extract_text_from_image(str(file_path))
+
+    document_id = add_document(file_path)
+    for mode, runner in runners.items():
+        for _ in range(warmup):
+            runner()
+
+        latencies = []
+        output = ""
+        for _ in range(iterations):
+            started = time.perf_counter()
+            output = runner()
+            latencies.append(time.perf_counter() - started)
+
+        if mode == "process_document_task":
+            output = load_text(document_id) or ""
+        result["modes"][mode] = {
+            **summarize(latencies, case.pages),
+            "accuracy": {
+                "character": character_accuracy(expected, output),
+                "word_error_rate": word_error_rate(expected, output),
+            },
+        }
+
+    result["peak_rss"] = peak_rss()
+    return result
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_revision": git_revision(),
+        "ocr_engine": settings.ocr_engine,
+        "ocr_engine_pool_size": settings.ocr_engine_pool_size,
+        "ocr_language": settings.ocr_language,
+        "pdf_dpi": settings.pdf_dpi,
+        "pdf_pages_per_task": settings.pdf_pages_per_task,
+        "preprocess_enabled": settings.preprocess_enabled,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the OCR pipeline on synthetic documents")
+    parser.add_argument("--output", default="ocr_benchmark.json", help="JSON file to write results to")
+    parser.add_argument("--cases", nargs="*", help="run only these cases (default: all)")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="keep rendered documents and databases here instead of a temp dir")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run all cases in this process; peak RSS is then cumulative across cases")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    cases = [case for case in CASES if not args.cases or case.name in args.cases]
+    unknown = set(args.cases or ()) - {case.name for case in cases}
+    if unknown:
+        sys.exit(f"Unknown cases: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(prefix="ocr-benchmark-") as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        os.makedirs(work_dir, exist_ok=True)
+
+        results = []
+        for case in cases:
+            case_args = (case, work_dir, args.seed, args.iterations, args.warmup)
+            if args.in_process:
+                result = run_case(*case_args)
+            else:
+                # a fresh process per case keeps peak RSS and the OCR engine warm-up attributable to that case
+                with multiprocessing.get_context("spawn").Pool(1) as pool:
+                    result = pool.apply(run_case, case_args)
+            results.append(result)
+
+            for mode, stats in result["modes"].items():
+                print(
+                    f"{case.name:<24} {mode:<24} "
+                    f"p50={stats['latency_seconds']['p50'] * 1000:8.1f}ms "
+                    f"p95={stats['latency_seconds']['p95'] * 1000:8.1f}ms "
+                    f"pages/s={stats['pages_per_second']:6.2f} "
+                    f"chars={stats['accuracy']['character']:.3f} "
+                    f"wer={stats['accuracy']['word_error_rate']:.3f}"
+                )
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "environment": environment(),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
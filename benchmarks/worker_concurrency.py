@@ -0,0 +1,134 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.infrastructure.concurrency import OCR_THREAD_LIMIT_ENV, available_cpus, cgroup_cpu_quota, process_counts
+from app.infrastructure.tasks import extract_text_from_image
+from benchmarks.ocr_pipeline import CASES, environment, render_page
+
+CELERY_DEFAULT = "celery-default"
+
+
+def layouts(cpus: int, selected: list[str] | None) -> list[tuple[str, int, int | None]]:
+    # the Celery default is one process per core with as many Tesseract threads as it wants
+    candidates = [(CELERY_DEFAULT, cpus, None)] + [
+        (f"{processes}x{cpus // processes}", processes, cpus // processes)
+        for processes in process_counts(cpus)
+    ]
+    if selected:
+        candidates = [layout for layout in candidates if layout[0] in selected]
+    return candidates
+
+
+def render_documents(case_name: str, directory: Path, count: int, seed: int) -> list[str]:
+    case = next(case for case in CASES if case.name == case_name)
+    rng = random.Random(f"{seed}:{case.name}")
+    paths = []
+    for index in range(count):
+        image, _ = render_page(case, rng)
+        path = directory / f"{case.name}_{index}.png"
+        image.save(path, dpi=(case.dpi, case.dpi))
+        paths.append(str(path))
+    return paths
+
+
+def recognize(path: str) -> float:
+    started = time.perf_counter()
+    extract_text_from_image(path)
+    return time.perf_counter() - started
+
+
+def run_layout(processes: int, threads: int | None, paths: list[str], documents: int) -> dict:
+    # spawned processes take the environment as it is now, and tesseract reads the limit from it
+    if threads is None:
+        os.environ.pop(OCR_THREAD_LIMIT_ENV, None)
+    else:
+        os.environ[OCR_THREAD_LIMIT_ENV] = str(threads)
+
+    work = [paths[index % len(paths)] for index in range(documents)]
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        # one document per process loads the engine before the clock starts
+        pool.map(recognize, paths[:1] * processes, chunksize=1)
+        started = time.perf_counter()
+        latencies = list(pool.imap_unordered(recognize, work, chunksize=1))
+        elapsed = time.perf_counter() - started
+
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {
+        "processes": processes,
+        "ocr_threads": threads,
+        "documents": documents,
+        "total_seconds": elapsed,
+        "documents_per_second": documents / elapsed,
+        "latency_seconds": {"p50": float(p50), "p95": float(p95), "max": max(latencies)},
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compare worker process/OCR thread splits of this machine's CPUs on synthetic documents"
+    )
+    parser.add_argument("--output", default="worker_concurrency_benchmark.json", help="JSON file to write results to")
+    parser.add_argument("--case", default="letter_300dpi",
+                        choices=[case.name for case in CASES if case.kind == "image"])
+    parser.add_argument("--layouts", nargs="*",
+                        help=f"run only these layouts, e.g. 8x2 {CELERY_DEFAULT} (default: every split)")
+    parser.add_argument("--cpus", type=int, help="CPUs to split (default: detected from affinity and cgroup quota)")
+    parser.add_argument("--documents", type=int, help="documents per layout (default: 4 per CPU)")
+    parser.add_argument("--distinct", type=int, default=8, help="distinct documents rendered and cycled through")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    cpus = args.cpus or available_cpus()
+    documents = args.documents or 4 * cpus
+    candidates = layouts(cpus, args.layouts)
+    if not candidates:
+        sys.exit(f"Unknown layouts: {', '.join(args.layouts)}")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="worker-benchmark-") as temp_dir:
+        paths = render_documents(args.case, Path(temp_dir), args.distinct, args.seed)
+        for name, processes, threads in candidates:
+            result = {"layout": name, **run_layout(processes, threads, paths, documents)}
+            results.append(result)
+            print(
+                f"{name:<16} processes={processes:<4} threads={threads or 'unlimited':<10} "
+                f"docs/s={result['documents_per_second']:7.2f} "
+                f"p50={result['latency_seconds']['p50'] * 1000:8.1f}ms "
+                f"p95={result['latency_seconds']['p95'] * 1000:8.1f}ms"
+            )
+
+    best = max(results, key=lambda result: result["documents_per_second"])
+    if best["ocr_threads"] is None:
+        print(f"Best: {best['layout']} (WORKER_CPU_MODE=celery)")
+    else:
+        print(f"Best: {best['layout']} (WORKER_CPU_MODE=auto OCR_THREADS_PER_PROCESS={best['ocr_threads']})")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "environment": {
+                **environment(),
+                "cpus": cpus,
+                "affinity_cpus": len(os.sched_getaffinity(0)),
+                "cgroup_cpu_quota": cgroup_cpu_quota(),
+            },
+            "case": args.case,
+            "best": best["layout"],
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
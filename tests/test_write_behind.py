@@ -0,0 +1,36 @@
+import pytest
+
+from app.infrastructure.write_behind import WriteBehindBuffer
+
+
+def test_failing_item_does_not_fail_its_batch():
+    stored = []
+
+    def flush(items):
+        if "bad" in items:
+            raise ValueError("foreign key violation")
+        stored.extend(items)
+
+    buffer = WriteBehindBuffer(flush, max_batch=8, max_delay=60.0)
+    items = ["a", "b", "bad", "c", "d", "e", "f", "g"]
+    futures = [buffer.submit(item) for item in items]
+    buffer.close()
+
+    for item, future in zip(items, futures):
+        if item == "bad":
+            with pytest.raises(ValueError):
+                future.result(timeout=1)
+        else:
+            assert future.result(timeout=1) is None
+    assert sorted(stored) == sorted(item for item in items if item != "bad")
+
+
+def test_batch_is_flushed_once_when_all_items_succeed():
+    batches = []
+    buffer = WriteBehindBuffer(batches.append, max_batch=4, max_delay=60.0)
+    futures = [buffer.submit(item) for item in range(4)]
+    for future in futures:
+        future.result(timeout=1)
+    buffer.close()
+
+    assert batches == [[0, 1, 2, 3]]